@@ -1,5 +1,21 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import pickle
+import struct
 import time
 
+LOG = logging.getLogger(__name__)
+
+SLOT_EMPTY = 0
+SLOT_USED = 1
+SLOT_DELETED = 2
+# state, key hash, expired at, key length, value length
+SLOT_HEADER = struct.Struct('<BQdII')
+
 
 class LocalCache(object):
 
@@ -25,3 +41,295 @@ class LocalCache(object):
         if self.expired:
             cached['expered_at'] = time.time() + self.expired
         self._data[key] = cached
+
+
+class AsyncLocalCache(LocalCache):
+    """LocalCache for coroutines
+
+    Concurrent awaiters of the same missing key share one task, so the
+    coroutine function is only awaited once. Cancelling an awaiter does not
+    cancel the shared task, and a failed or cancelled task is not cached.
+
+    >>> cache = AsyncLocalCache(expired=60)
+    >>> @cache.memoize
+    ... async def get_server(server_id):
+    ...     ...
+    """
+
+    def __init__(self, expired=None) -> None:
+        super().__init__(expired=expired)
+        self._pending = {}
+
+    async def get_or_set(self, key, func, *args, **kwargs):
+        cached = self.get(key)
+        if cached:
+            return cached['data']
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._pending[key] = task
+            task.add_done_callback(
+                functools.partial(self._on_task_done, key))
+        return await asyncio.shield(task)
+
+    def _on_task_done(self, key, task):
+        if self._pending.get(key) is task:
+            del self._pending[key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            LOG.debug('not cache %s, %s', key, task.exception())
+            return
+        self.set(key, task.result())
+
+    def memoize(self, func):
+        if not asyncio.iscoroutinefunction(func):
+            raise TypeError(f'{func} is not a coroutine function')
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+            return await self.get_or_set(key, func, *args, **kwargs)
+
+        return wrapper
+
+
+class SharedMemoryCache(object):
+    """A cache shared by the processes forked from the creator
+
+    Items are stored in a fixed-size open-addressing hash table (linear
+    probing) inside an anonymous shared mmap, keys and values are pickled.
+    The cache must be created before forking, e.g. before
+    `web.application.TornadoApp.start(num_processes=N)`, so that all of the
+    workers map the same memory and inherit the same locks.
+
+    Slot locks are striped, a slot is protected by the lock
+    `slot_index % lock_stripes`. Writers of the same key are serialized by a
+    second set of striped key locks, which are always acquired before the
+    slot locks.
+
+    Deleted and expired items leave tombstones, when the tombstones exceed
+    `max_tombstones` (a quarter of the capacity by default), the table is
+    rebuilt with all of the locks held. A key is stored within `max_probe`
+    slots from its home slot, so a miss never scans the whole table.
+
+    >>> cache = SharedMemoryCache(capacity=1024, expired=60)
+    >>> cache.set('foo', {'bar': 1})
+    >>> cache.get('foo')
+    {'data': {'bar': 1}, 'expered_at': ...}
+    """
+
+    def __init__(self, capacity=1024, slot_size=1024, expired=None,
+                 lock_stripes=64, max_probe=64, max_tombstones=None):
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError(f'slot size must be greater than '
+                             f'{SLOT_HEADER.size}')
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.expired = expired
+        self.lock_stripes = min(lock_stripes, capacity)
+        self.max_probe = min(max_probe, capacity)
+        self.max_tombstones = max_tombstones or max(capacity // 4, 1)
+        self._tombstones = multiprocessing.Value('i', 0)
+        self._mm = mmap.mmap(-1, capacity * slot_size)
+        self._slot_locks = [multiprocessing.Lock()
+                            for _ in range(self.lock_stripes)]
+        self._key_locks = [multiprocessing.Lock()
+                           for _ in range(self.lock_stripes)]
+
+    @property
+    def max_item_size(self):
+        return self.slot_size - SLOT_HEADER.size
+
+    def _hash(self, key_bytes):
+        return int.from_bytes(
+            hashlib.blake2b(key_bytes, digest_size=8).digest(), 'little')
+
+    def _slot_lock(self, index):
+        return self._slot_locks[index % self.lock_stripes]
+
+    def _key_lock(self, key_hash):
+        return self._key_locks[key_hash % self.lock_stripes]
+
+    def _probe(self, key_hash):
+        home = key_hash % self.capacity
+        for i in range(self.max_probe):
+            yield (home + i) % self.capacity
+
+    def _read_header(self, index):
+        return SLOT_HEADER.unpack_from(self._mm, index * self.slot_size)
+
+    def _set_state(self, index, state):
+        self._mm[index * self.slot_size] = state
+
+    def _add_tombstones(self, count):
+        with self._tombstones.get_lock():
+            self._tombstones.value += count
+            return self._tombstones.value
+
+    def _delete_slot(self, index):
+        """Mark the slot as deleted, return True if the table should be
+        rebuilt. The slot lock must be held.
+        """
+        self._set_state(index, SLOT_DELETED)
+        return self._add_tombstones(1) > self.max_tombstones
+
+    def _acquire_all(self):
+        for lock in self._key_locks + self._slot_locks:
+            lock.acquire()
+
+    def _release_all(self):
+        for lock in self._key_locks + self._slot_locks:
+            lock.release()
+
+    def _rebuild(self):
+        """Reinsert the live items to remove the tombstones"""
+        self._acquire_all()
+        try:
+            if self._tombstones.value <= self.max_tombstones:
+                return
+            now = time.time()
+            items = []
+            for index in range(self.capacity):
+                state, key_hash, expired_at, key_len, value_len = \
+                    self._read_header(index)
+                if state != SLOT_USED or (expired_at and now > expired_at):
+                    continue
+                items.append((key_hash, self._read_key(index, key_len),
+                              self._read_value(index, key_len, value_len),
+                              expired_at))
+            for index in range(self.capacity):
+                self._set_state(index, SLOT_EMPTY)
+            for key_hash, key_bytes, value_bytes, expired_at in items:
+                for index in self._probe(key_hash):
+                    if self._read_header(index)[0] == SLOT_EMPTY:
+                        self._write(index, key_hash, key_bytes, value_bytes,
+                                    expired_at)
+                        break
+            self._tombstones.value = 0
+            LOG.debug('shared cache is rebuilt, %s items', len(items))
+        finally:
+            self._release_all()
+
+    def _read_key(self, index, key_len):
+        offset = index * self.slot_size + SLOT_HEADER.size
+        return self._mm[offset:offset + key_len]
+
+    def _read_value(self, index, key_len, value_len):
+        offset = index * self.slot_size + SLOT_HEADER.size + key_len
+        return self._mm[offset:offset + value_len]
+
+    def _write(self, index, key_hash, key_bytes, value_bytes, expired_at):
+        offset = index * self.slot_size
+        payload = key_bytes + value_bytes
+        self._mm[offset + SLOT_HEADER.size:
+                 offset + SLOT_HEADER.size + len(payload)] = payload
+        SLOT_HEADER.pack_into(self._mm, offset, SLOT_USED, key_hash,
+                              expired_at, len(key_bytes), len(value_bytes))
+
+    def _match(self, index, key_hash, key_bytes):
+        """Return (state, header) of the slot, the state of a slot which
+        holds another key is None.
+        """
+        header = self._read_header(index)
+        state, slot_hash, _, key_len, _ = header
+        if state == SLOT_USED and (
+                slot_hash != key_hash or
+                self._read_key(index, key_len) != key_bytes):
+            return None, header
+        return state, header
+
+    def _find(self, key_hash, key_bytes):
+        for index in self._probe(key_hash):
+            with self._slot_lock(index):
+                state, _ = self._match(index, key_hash, key_bytes)
+            if state == SLOT_EMPTY:
+                return None
+            if state == SLOT_USED:
+                return index
+        return None
+
+    def get(self, key):
+        key_bytes = pickle.dumps(key)
+        key_hash = self._hash(key_bytes)
+        for index in self._probe(key_hash):
+            with self._slot_lock(index):
+                state, header = self._match(index, key_hash, key_bytes)
+                if state == SLOT_EMPTY:
+                    return None
+                if state != SLOT_USED:
+                    continue
+                _, _, expired_at, key_len, value_len = header
+                expired = expired_at and time.time() > expired_at
+                if expired:
+                    rebuild = self._delete_slot(index)
+                else:
+                    value_bytes = self._read_value(index, key_len, value_len)
+            if expired:
+                if rebuild:
+                    self._rebuild()
+                return None
+            cached = {'data': pickle.loads(value_bytes)}
+            if expired_at:
+                cached['expered_at'] = expired_at
+            return cached
+        return None
+
+    def set(self, key, value):
+        key_bytes = pickle.dumps(key)
+        value_bytes = pickle.dumps(value)
+        if len(key_bytes) + len(value_bytes) > self.max_item_size:
+            raise ValueError(f'item of {key} is larger than '
+                             f'{self.max_item_size} bytes')
+        key_hash = self._hash(key_bytes)
+        expired_at = time.time() + self.expired if self.expired else 0
+
+        with self._key_lock(key_hash):
+            index = self._find(key_hash, key_bytes)
+            if index is not None:
+                with self._slot_lock(index):
+                    state, _ = self._match(index, key_hash, key_bytes)
+                    if state == SLOT_USED:
+                        self._write(index, key_hash, key_bytes, value_bytes,
+                                    expired_at)
+                        return
+            for index in self._probe(key_hash):
+                with self._slot_lock(index):
+                    state = self._read_header(index)[0]
+                    if state == SLOT_USED:
+                        continue
+                    self._write(index, key_hash, key_bytes, value_bytes,
+                                expired_at)
+                if state == SLOT_DELETED:
+                    self._add_tombstones(-1)
+                return
+        LOG.warning('shared cache is full, %s is not cached', key)
+
+    def delete(self, key):
+        key_bytes = pickle.dumps(key)
+        key_hash = self._hash(key_bytes)
+        rebuild = False
+        with self._key_lock(key_hash):
+            index = self._find(key_hash, key_bytes)
+            if index is None:
+                return
+            with self._slot_lock(index):
+                state, _ = self._match(index, key_hash, key_bytes)
+                if state == SLOT_USED:
+                    rebuild = self._delete_slot(index)
+        if rebuild:
+            self._rebuild()
+
+    def clean(self):
+        self._acquire_all()
+        try:
+            for index in range(self.capacity):
+                self._set_state(index, SLOT_EMPTY)
+            self._tombstones.value = 0
+        finally:
+            self._release_all()
+
+    def __len__(self):
+        return sum(1 for index in range(self.capacity)
+                   if self._mm[index * self.slot_size] == SLOT_USED)
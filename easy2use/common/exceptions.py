@@ -20,3 +20,15 @@ class LoopTimeout(BaseException):
 
 class RetryTimeout(BaseException):
     _msg = 'retry timeout({timeout}s)'
+
+
+class ExecuteTimeout(BaseException):
+    _msg = 'execute "{cmd}" timeout({timeout}s)'
+
+
+class ShellSessionExited(BaseException):
+    _msg = 'shell session exited while executing "{cmd}"'
+
+
+class CircuitOpen(BaseException):
+    _msg = 'circuit {name} is open'
@@ -1,4 +1,14 @@
+import asyncio
+import collections
+from concurrent import futures
+import contextlib
+import functools
+import heapq
+import inspect
+import itertools
 import logging
+import random
+import threading
 import time
 
 from easy2use.common import exceptions
@@ -6,22 +16,197 @@ from easy2use.common import exceptions
 LOG = logging.getLogger(__name__)
 
 
+class FixedBackoff(object):
+    """Sleep the same interval between attempts"""
+
+    def __init__(self, interval=1):
+        self.interval = interval
+
+    def __call__(self, attempt, previous=None):
+        return self.interval
+
+
+class ExponentialBackoff(object):
+    """Exponential backoff with optional jitter
+
+    jitter:
+      None: base * multiplier ** attempt, at most cap
+      full: random between 0 and the exponential interval
+      decorrelated: random between base and previous * 3, at most cap
+    """
+    JITTERS = (None, 'full', 'decorrelated')
+
+    def __init__(self, base=0.1, cap=60, multiplier=2, jitter='full'):
+        if jitter not in self.JITTERS:
+            raise ValueError(f'jitter must be one of {self.JITTERS}')
+        self.base = base
+        self.cap = cap
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def __call__(self, attempt, previous=None):
+        """attempt starts from 0, previous is the last interval"""
+        if self.jitter == 'decorrelated':
+            return min(self.cap,
+                       random.uniform(self.base, (previous or self.base) * 3))
+        interval = min(self.cap, self.base * self.multiplier ** attempt)
+        if self.jitter == 'full':
+            return random.uniform(0, interval)
+        return interval
+
+
+class RetryBudget(object):
+    """Cap retries as a fraction of the requests
+
+    In the latest `window` seconds, retries are allowed while
+    retries < requests * ratio + min_per_second * window, so when a backend
+    degrades the clients stop multiplying its load. The budget is shared by
+    all the callers which use the same object.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=1, window=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests = collections.deque()
+        self._retries = collections.deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        expired_at = now - self.window
+        for events in (self._requests, self._retries):
+            while events and events[0] <= expired_at:
+                events.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._requests.append(now)
+
+    def try_retry(self):
+        """Withdraw one retry, return False if the budget is exhausted"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            allowed = len(self._requests) * self.ratio + \
+                self.min_per_second * self.window
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+class CircuitBreaker(object):
+    """Fail fast while a dependency is down
+
+    After `failure_threshold` consecutive failures the circuit is opened and
+    calls raise CircuitOpen immediately. After `recovery_timeout` seconds it
+    is half-opened and one trial call is allowed, the circuit is closed if
+    the trial succeeds, else it is opened again.
+    e.g.
+    >>> breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=30)
+    >>> @breaker
+    >>> def get_servers():
+    >>>     return client.get('/servers')
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30,
+                 expected_exceptions=(Exception,), name=None):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.expected_exceptions = tuple(expected_exceptions)
+        self.name = name
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and \
+               time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._state = self.HALF_OPEN
+            return self._state
+
+    def _before_call(self):
+        state = self.state
+        with self._lock:
+            if state == self.OPEN or \
+               (state == self.HALF_OPEN and self._trial_running):
+                raise exceptions.CircuitOpen(name=self.name or '')
+            if state == self.HALF_OPEN:
+                self._trial_running = True
+
+    def _on_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                LOG.info('circuit %s closed', self.name or '')
+            self._state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def _on_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or \
+               self.failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    LOG.warning('circuit %s opened, failures=%s',
+                                self.name or '', self.failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except self.expected_exceptions:
+            self._on_failure()
+            raise
+        except BaseException:
+            with self._lock:
+                self._trial_running = False
+            raise
+        self._on_success()
+        return result
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
+
+
 def retry_for(func, args=(), kwargs=None, interval=1, timeout=None,
-              finish_func=None, retry_exceptions=None):
+              finish_func=None, retry_exceptions=None, backoff=None):
     kwargs = kwargs or {}
+    backoff = backoff or FixedBackoff(interval)
+    if isinstance(retry_exceptions, type):
+        retry_exceptions = (retry_exceptions,)
+    retry_exceptions = tuple(retry_exceptions or ())
     end_time = time.time() + timeout if timeout else None
     retry_times = 0
+    sleep_time = None
     while True:
         try:
             result = func(*args, **kwargs)
             if finish_func and finish_func(result):
-                break
+                return result
         except Exception as e:
-            if not retry_exceptions or not isinstance(e, *retry_exceptions):
+            if not retry_exceptions or not isinstance(e, retry_exceptions):
                 raise
         if end_time and time.time() >= end_time:
             raise exceptions.LoopTimeout(timeout=timeout, times=retry_times)
-        time.sleep(interval)
+        sleep_time = backoff(retry_times, sleep_time)
+        time.sleep(sleep_time)
         retry_times += 1
         LOG.debug('retry function: %s, times=%s', func, retry_times)
 
@@ -39,3 +224,349 @@ def retry_untile_true(func, args=(), kwargs=None, interval=1, timeout=None):
         time.sleep(interval)
         retry_times += 1
         LOG.debug('retry function: %s, times=%s', func, retry_times)
+
+
+class _Poll(object):
+
+    def __init__(self, check, args, kwargs, interval, deadline, finish_func,
+                 timeout):
+        self.check = check
+        self.args = args
+        self.kwargs = kwargs
+        self.interval = interval
+        self.deadline = deadline
+        self.finish_func = finish_func
+        self.timeout = timeout
+        self.times = 0
+        self.future = futures.Future()
+
+
+class PollScheduler(object):
+    """Run many polls on one scheduler thread
+
+    Instead of one sleeping thread per retry_untile_true, the polls are kept
+    in a heap ordered by their next check time, and one thread runs the
+    checks when they are due. If `workers` is set, the checks run in a
+    thread pool of that size, so a slow check does not delay the others.
+    e.g.
+    >>> scheduler = PollScheduler(workers=4)
+    >>> future = scheduler.wait(server_is_active, args=(server_id,),
+    ...                         interval=5, timeout=600)
+    >>> future.result()
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._stopped = False
+
+    def start(self):
+        with self._cond:
+            if self._thread:
+                return
+            if self.workers:
+                self._executor = futures.ThreadPoolExecutor(self.workers)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def wait(self, check, args=(), kwargs=None, interval=1, timeout=None,
+             finish_func=None):
+        """Return a Future which is resolved with the result of check when
+        finish_func(result) is True (or result is True if finish_func is
+        None). It fails with RetryTimeout at the timeout, or with the
+        exception raised by check.
+        """
+        if self._stopped:
+            raise RuntimeError('poll scheduler is stopped')
+        self.start()
+        now = time.monotonic()
+        poll = _Poll(check, args, kwargs or {}, interval,
+                     now + timeout if timeout else None, finish_func, timeout)
+        self._schedule(poll, now)
+        return poll.future
+
+    def _schedule(self, poll, at):
+        with self._cond:
+            heapq.heappush(self._heap, (at, next(self._counter), poll))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now
+                                    if self._heap else None)
+                if self._stopped:
+                    return
+                _, _, poll = heapq.heappop(self._heap)
+            if self._executor:
+                self._executor.submit(self._check, poll)
+            else:
+                self._check(poll)
+
+    @staticmethod
+    def _resolve(poll, result=None, error=None):
+        with contextlib.suppress(futures.InvalidStateError):
+            if error is not None:
+                poll.future.set_exception(error)
+            else:
+                poll.future.set_result(result)
+
+    def _check(self, poll):
+        if poll.future.done():
+            return
+        try:
+            result = poll.check(*poll.args, **poll.kwargs)
+        except Exception as e:
+            self._resolve(poll, error=e)
+            return
+        finished = poll.finish_func(result) if poll.finish_func \
+            else result is True
+        if finished:
+            self._resolve(poll, result=result)
+            return
+        now = time.monotonic()
+        if poll.deadline and now >= poll.deadline:
+            self._resolve(poll, error=exceptions.RetryTimeout(
+                timeout=poll.timeout, times=poll.times))
+            return
+        poll.times += 1
+        LOG.debug('retry function: %s, times=%s', poll.check, poll.times)
+        next_time = now + poll.interval
+        if poll.deadline:
+            next_time = min(next_time, poll.deadline)
+        self._schedule(poll, next_time)
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def stop(self, cancel=True):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        # the running checks may schedule their polls again, so the heap is
+        # collected after they are finished
+        with self._cond:
+            polls = [poll for _, _, poll in self._heap]
+            self._heap.clear()
+        if cancel:
+            for poll in polls:
+                poll.future.cancel()
+
+
+def retry_call(func, args=(), kwargs=None, retry_exceptions=(Exception,),
+               max_attempts=3, backoff=None, budget=None, timeout=None):
+    """Call func and retry it when it raises retry_exceptions
+
+    The last exception is raised if max_attempts is reached, the budget
+    is exhausted or the next sleep would exceed the timeout.
+    """
+    kwargs = kwargs or {}
+    backoff = backoff or ExponentialBackoff()
+    retry_exceptions = tuple(retry_exceptions)
+    end_time = time.monotonic() + timeout if timeout else None
+    sleep_time = None
+    if budget:
+        budget.record_request()
+    for attempt in range(max_attempts):
+        try:
+            return func(*args, **kwargs)
+        except retry_exceptions as e:
+            if attempt + 1 >= max_attempts:
+                raise
+            sleep_time = backoff(attempt, sleep_time)
+            if end_time and time.monotonic() + sleep_time >= end_time:
+                raise
+            if budget and not budget.try_retry():
+                LOG.warning('retry budget exhausted, not retry %s', func)
+                raise
+            LOG.debug('retry function: %s after %.3fs, error: %s',
+                      func, sleep_time, e)
+            time.sleep(sleep_time)
+
+
+def retry(retry_exceptions=(Exception,), max_attempts=3, backoff=None,
+          budget=None, timeout=None):
+    """Decorator of retry_call
+    e.g.
+    >>> budget = RetryBudget(ratio=0.1)
+    >>> @retry(retry_exceptions=(client.InternalServerError,),
+    ...        backoff=ExponentialBackoff(jitter='decorrelated'),
+    ...        budget=budget)
+    >>> def get_servers():
+    >>>     return client.get('/servers')
+    """
+    def _retry(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return retry_call(func, args=args, kwargs=kwargs,
+                              retry_exceptions=retry_exceptions,
+                              max_attempts=max_attempts, backoff=backoff,
+                              budget=budget, timeout=timeout)
+
+        return wrapper
+
+    return _retry
+
+
+async def _call(func, args, kwargs):
+    result = func(*args, **kwargs)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def hedged_call(func, args=(), kwargs=None, delay=0.1, hedges=1):
+    """Call the coroutine function, and if it does not finish in `delay`
+    seconds, start another attempt (at most `hedges` extra attempts). The
+    first successful result is returned and the other attempts are
+    cancelled, if all the attempts fail, the last exception is raised.
+    Only a slow attempt is hedged, a failure is not, it is left to the
+    retry loop (e.g. async_retry_call) and its RetryBudget.
+    """
+    kwargs = kwargs or {}
+    tasks = {asyncio.ensure_future(_call(func, args, kwargs))}
+    started = 1
+    error = None
+    try:
+        while tasks:
+            can_hedge = started <= hedges
+            done, tasks = await asyncio.wait(
+                tasks, timeout=delay if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if can_hedge and not done:
+                LOG.debug('start hedged attempt %s of %s', started, func)
+                tasks.add(asyncio.ensure_future(_call(func, args, kwargs)))
+                started += 1
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def async_retry_for(func, args=(), kwargs=None, interval=1,
+                          timeout=None, finish_func=None,
+                          retry_exceptions=None, backoff=None):
+    """The asyncio version of retry_for, func may be a coroutine function.
+    Sleep with asyncio.sleep, so the event loop is not blocked, and the
+    loop can be cancelled at any await point. An attempt is cancelled at
+    the timeout too, rather than checked after it returns.
+    """
+    kwargs = kwargs or {}
+    backoff = backoff or FixedBackoff(interval)
+    if isinstance(retry_exceptions, type):
+        retry_exceptions = (retry_exceptions,)
+    retry_exceptions = tuple(retry_exceptions or ())
+    loop = asyncio.get_running_loop()
+    end_time = loop.time() + timeout if timeout else None
+    retry_times = 0
+    sleep_time = None
+    while True:
+        try:
+            attempt = _call(func, args, kwargs)
+            if end_time:
+                attempt = asyncio.wait_for(
+                    attempt, max(end_time - loop.time(), 0))
+            result = await attempt
+            if finish_func and finish_func(result):
+                return result
+        except Exception as e:
+            if end_time and isinstance(e, asyncio.TimeoutError) and \
+               loop.time() >= end_time:
+                raise exceptions.LoopTimeout(timeout=timeout,
+                                             times=retry_times) from e
+            if not retry_exceptions or not isinstance(e, retry_exceptions):
+                raise
+        if end_time and loop.time() >= end_time:
+            raise exceptions.LoopTimeout(timeout=timeout, times=retry_times)
+        sleep_time = backoff(retry_times, sleep_time)
+        if end_time:
+            sleep_time = min(sleep_time, max(end_time - loop.time(), 0))
+        await asyncio.sleep(sleep_time)
+        retry_times += 1
+        LOG.debug('retry function: %s, times=%s', func, retry_times)
+
+
+async def async_retry_untile_true(func, args=(), kwargs=None, interval=1,
+                                  timeout=None):
+    """The asyncio version of retry_untile_true"""
+    try:
+        return await async_retry_for(func, args=args, kwargs=kwargs,
+                                     interval=interval, timeout=timeout,
+                                     finish_func=lambda result: result is True)
+    except exceptions.LoopTimeout as e:
+        raise exceptions.RetryTimeout(timeout=timeout) from e
+
+
+async def async_retry_call(func, args=(), kwargs=None,
+                           retry_exceptions=(Exception,), max_attempts=3,
+                           backoff=None, budget=None, timeout=None,
+                           hedge_delay=None):
+    """The asyncio version of retry_call
+
+    If hedge_delay is set, every attempt is a hedged_call which starts a
+    second request when the first one is slower than hedge_delay seconds.
+    """
+    kwargs = kwargs or {}
+    backoff = backoff or ExponentialBackoff()
+    retry_exceptions = tuple(retry_exceptions)
+    loop = asyncio.get_running_loop()
+    end_time = loop.time() + timeout if timeout else None
+    sleep_time = None
+    if budget:
+        budget.record_request()
+    for attempt in range(max_attempts):
+        try:
+            if hedge_delay:
+                call = hedged_call(func, args, kwargs, delay=hedge_delay)
+            else:
+                call = _call(func, args, kwargs)
+            if end_time:
+                return await asyncio.wait_for(
+                    call, max(end_time - loop.time(), 0))
+            return await call
+        except retry_exceptions as e:
+            if attempt + 1 >= max_attempts:
+                raise
+            sleep_time = backoff(attempt, sleep_time)
+            if end_time and loop.time() + sleep_time >= end_time:
+                raise
+            if budget and not budget.try_retry():
+                LOG.warning('retry budget exhausted, not retry %s', func)
+                raise
+            LOG.debug('retry function: %s after %.3fs, error: %s',
+                      func, sleep_time, e)
+            await asyncio.sleep(sleep_time)
+
+
+def async_retry(retry_exceptions=(Exception,), max_attempts=3, backoff=None,
+                budget=None, timeout=None, hedge_delay=None):
+    """Decorator of async_retry_call"""
+    def _retry(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await async_retry_call(
+                func, args=args, kwargs=kwargs,
+                retry_exceptions=retry_exceptions, max_attempts=max_attempts,
+                backoff=backoff, budget=budget, timeout=timeout,
+                hedge_delay=hedge_delay)
+
+        return wrapper
+
+    return _retry
@@ -1,12 +1,128 @@
+import collections
 from concurrent import futures
+import itertools
+import os
+import threading
+import time
 
 
-def run_concurrent(fn, maps=None, nums=None, max_workers=None):
-    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        if maps:
-            tasks = executor.map(fn, maps)
-        elif nums:
-            tasks = [executor.submit(fn) for _ in range(maps)]
-        for task in tasks:
-            task.done()
-            yield
+class TokenBucket(object):
+    """A token bucket shared by threads
+
+    Tokens are refilled at `rate` per second up to `burst` (defaults to one
+    second of tokens). consume() blocks until the tokens are available, an
+    amount larger than the burst is allowed and paid back by the later
+    consumers, so it can be used to limit the bandwidth, e.g. bytes per
+    second.
+
+    >>> bucket = TokenBucket(1024 * 1024)
+    >>> for data in resp.stream():
+    >>>     bucket.consume(len(data))
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0')
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._tokens + (now - self._updated_at) * self.rate,
+                self.burst)
+            self._updated_at = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RateLimiter(TokenBucket):
+    """Allow at most `rate` acquires per second, it is a TokenBucket without
+    burst
+
+    >>> limiter = RateLimiter(10)
+    >>> for _ in range(100):
+    >>>     limiter.acquire()
+    """
+
+    def __init__(self, rate):
+        super(RateLimiter, self).__init__(rate, burst=1)
+
+    def acquire(self):
+        self.consume(1)
+
+
+def iter_completed(executor, fn, items, max_inflight, ordered=True,
+                   limiter=None):
+    """Submit fn(item) to the executor with at most `max_inflight` pending
+    futures, yield the done futures in input order if ordered is True, else
+    in completion order. The pending futures are cancelled and the executor
+    is shut down when it is closed.
+    e.g.
+    >>> executor = futures.ThreadPoolExecutor(max_workers=10)
+    >>> for future in iter_completed(executor, fetch, urls, 20):
+    ...     print(future.result())
+    """
+    iterator = iter(items)
+    pending = collections.deque() if ordered else set()
+
+    def _submit():
+        for item in itertools.islice(iterator, max_inflight - len(pending)):
+            if limiter:
+                limiter.acquire()
+            future = executor.submit(fn, item)
+            if ordered:
+                pending.append(future)
+            else:
+                pending.add(future)
+
+    try:
+        _submit()
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = futures.wait(pending,
+                                       return_when=futures.FIRST_COMPLETED)
+                pending.difference_update(done)
+            for future in done:
+                yield future
+            _submit()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def run_concurrent(fn, maps=None, nums=None, max_workers=None, ordered=True,
+                   max_inflight=None, rate=None):
+    """Map fn over maps (or call fn nums times) in threads, yield results
+
+    At most `max_inflight` items (defaults to twice max_workers) are
+    submitted at the same time, so the input is consumed lazily, and if
+    `rate` is set, at most `rate` items are submitted per second. Results
+    are yielded in input order if ordered is True, else in completion
+    order. If fn raises, the pending items are cancelled and the exception
+    is raised.
+    e.g.
+    >>> for result in run_concurrent(fetch, maps=urls, max_workers=10,
+    ...                              ordered=False, rate=100):
+    ...     print(result)
+    """
+    if maps is not None:
+        items, call = maps, fn
+    elif nums:
+        items, call = range(nums), lambda _: fn()
+    else:
+        return
+    max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+    executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+    for future in iter_completed(executor, call, items,
+                                 max_inflight or max_workers * 2,
+                                 ordered=ordered,
+                                 limiter=RateLimiter(rate) if rate else None):
+        yield future.result()
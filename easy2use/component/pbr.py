@@ -4,6 +4,7 @@ Progress bar
 from __future__ import print_function
 import contextlib
 import logging
+import sys
 import threading
 import time
 import abc
@@ -109,6 +110,157 @@ class TqdmBar(PrinterBar):
         self.pbar.set_description(*args, **kwargs)
 
 
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f'{size:.1f}{unit}' if unit != 'B' else f'{int(size)}B'
+        size /= 1024
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '--:--:--'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours:02}:{minutes:02}:{seconds:02}'
+
+
+class TaskProgress(ProgressBar):
+    """The progress of one task of MultiProgress
+
+    update() does not take a lock, every thread only adds to its own
+    counter, and the counters are summed when the progress is rendered.
+    """
+
+    def __init__(self, total, description=None):
+        super().__init__(total, description)
+        self.closed = False
+        self._counters = {}
+
+    def update(self, size):
+        ident = threading.get_ident()
+        self._counters[ident] = self._counters.get(ident, 0) + size
+
+    @property
+    def completed(self):
+        return sum(list(self._counters.values()))
+
+    def set_description(self, description, *args, **kwargs):
+        self.description = description
+
+    def close(self):
+        self.closed = True
+
+
+class MultiProgress(object):
+    """Show the total progress of many tasks with one render thread
+
+    Tasks only update their own counters, the render thread draws the total
+    bytes, rate, ETA and the top N active tasks (by remaining bytes) every
+    `interval` seconds. If the stream is not a tty, only the total line is
+    written.
+
+    >>> with MultiProgress(top=5) as progress:
+    >>>     bar = progress.factory(1024, description='foo.iso')
+    >>>     bar.update(512)
+    >>>     bar.close()
+    """
+
+    def __init__(self, interval=0.5, top=5, stream=None, total=None):
+        """
+        Args:
+            total (int, optional): The total bytes of all the tasks, if it
+                is not specified, it is the sum of the totals of the added
+                tasks.
+        """
+        self.interval = interval
+        self.top = top
+        self.stream = stream or sys.stderr
+        self.total = total
+        self.tasks = []
+        self.rate = 0.0
+        self._lines = 0
+        self._last = (None, 0)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def factory(self, total, description=None, **kwargs):
+        task = TaskProgress(total, description=description)
+        # list.append is atomic, the render thread iterates on a copy
+        self.tasks.append(task)
+        return task
+
+    @property
+    def completed(self):
+        return sum(task.completed for task in list(self.tasks))
+
+    def _update_rate(self, now, completed):
+        last_time, last_completed = self._last
+        self._last = (now, completed)
+        if last_time is None or now <= last_time:
+            return
+        rate = (completed - last_completed) / (now - last_time)
+        # exponential moving average, so the ETA does not jump
+        self.rate = rate if not self.rate else self.rate * 0.7 + rate * 0.3
+
+    def render(self):
+        tasks = list(self.tasks)
+        completed = sum(task.completed for task in tasks)
+        total = self.total or sum(task.total or 0 for task in tasks)
+        now = time.monotonic()
+        self._update_rate(now, completed)
+        eta = (total - completed) / self.rate \
+            if self.rate and total >= completed else None
+        done = sum(1 for task in tasks if task.closed)
+        percent = f'{completed * 100 / total:.1f}%' if total else '--'
+        lines = [f'{done}/{len(tasks)} files {format_size(completed)}/'
+                 f'{format_size(total)} {percent} '
+                 f'{format_size(self.rate)}/s ETA {format_seconds(eta)}']
+        if self.stream.isatty():
+            active = [task for task in tasks if not task.closed]
+            active.sort(key=lambda task: (task.total or 0) - task.completed,
+                        reverse=True)
+            for task in active[:self.top]:
+                percent = f'{task.completed * 100 / task.total:5.1f}%' \
+                    if task.total else '  -- '
+                lines.append(f'  {task.description[:50]:50} {percent} '
+                             f'{format_size(task.completed)}')
+            # move to the first line of the last render and clear it
+            output = (f'\x1b[{self._lines}F' if self._lines else '') + \
+                '\x1b[J' + '\n'.join(lines) + '\n'
+            self._lines = len(lines)
+        else:
+            output = lines[0] + '\n'
+        self.stream.write(output)
+        self.stream.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.render()
+            except Exception as e:
+                LOG.warning('render progress failed, %s', e)
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.render()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.stop()
+
+
 def factory(total, description=None, interval=None, driver=None):
     bar_cls = None
     driver = driver or 'tqdm'
@@ -0,0 +1,290 @@
+import asyncio
+import collections
+from concurrent import futures
+import hashlib
+import logging
+import os
+import ssl
+from urllib import parse as urllib_parse
+
+from easy2use.common import exceptions
+from easy2use.component import pbr
+from easy2use.downloader import driver
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PER_HOST_LIMIT = 8
+DEFAULT_WRITE_WORKERS = 4
+READ_SIZE = 64 * 1024
+WRITE_SIZE = 1024 * 1024
+MAX_REDIRECTS = 5
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+
+class DownloadFailed(exceptions.BaseException):
+    _msg = 'download {url} failed, status: {status}'
+
+
+class _Connection(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class _Response(object):
+
+    def __init__(self, status, headers, conn, timeout=None):
+        self.status = status
+        self.headers = headers
+        self.conn = conn
+        self.timeout = timeout
+        self.reusable = headers.get('connection', '').lower() != 'close'
+
+    async def _read(self, read):
+        """Await a read of the body, fail if the server stalls longer than
+        the timeout.
+        """
+        return await asyncio.wait_for(read, self.timeout)
+
+    async def stream(self, read_size=READ_SIZE):
+        reader = self.conn.reader
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self._read(reader.readline()))
+                           .split(b';')[0], 16)
+                if not size:
+                    while (await self._read(reader.readline())).strip():
+                        pass
+                    return
+                remaining = size
+                while remaining:
+                    data = await self._read(
+                        reader.read(min(remaining, read_size)))
+                    if not data:
+                        raise asyncio.IncompleteReadError(b'', remaining)
+                    remaining -= len(data)
+                    yield data
+                await self._read(reader.readexactly(2))
+        elif 'content-length' in self.headers:
+            remaining = int(self.headers['content-length'])
+            while remaining:
+                data = await self._read(
+                    reader.read(min(remaining, read_size)))
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(data)
+                yield data
+        else:
+            self.reusable = False
+            data = await self._read(reader.read(read_size))
+            while data:
+                yield data
+                data = await self._read(reader.read(read_size))
+
+
+class AsyncioDriver(driver.BaseDownloadDriver):
+    """Download driver based on asyncio streams
+
+    All the downloads run on one event loop thread, so thousands of
+    downloads can be in flight at the same time, `workers` is the number of
+    concurrent downloads. Connections are kept alive and reused, and at most
+    `per_host_limit` connections are opened to one host. Files are written
+    by a small thread pool, so disk I/O does not block the event loop.
+    `timeout` applies to connecting and to every read of a response.
+    Checksums are verified while streaming, the download cache is not
+    supported.
+    e.g.
+    >>> downloader = AsyncioDriver(workers=1000, per_host_limit=16)
+    >>> downloader.download_urls(urls)
+    """
+
+    def __init__(self, per_host_limit=None, write_workers=None,
+                 buffer_size=None, **kwargs):
+        super(AsyncioDriver, self).__init__(**kwargs)
+        if self.cache or self.force:
+            raise ValueError('AsyncioDriver does not support the download '
+                             'cache')
+        self.per_host_limit = per_host_limit or self.host_connections or \
+            DEFAULT_PER_HOST_LIMIT
+        self.write_workers = write_workers or DEFAULT_WRITE_WORKERS
+        self.buffer_size = buffer_size or READ_SIZE
+        self._host_limits = {}
+        self._idle = collections.defaultdict(list)
+        self._file_executor = None
+        self._ssl_context = None
+
+    def _host_limit(self, key):
+        if key not in self._host_limits:
+            self._host_limits[key] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[key]
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        while self._idle[key]:
+            conn = self._idle[key].pop()
+            if not conn.reader.at_eof():
+                return conn
+            conn.close()
+        if scheme == 'https' and not self._ssl_context:
+            self._ssl_context = ssl.create_default_context()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port,
+                ssl=self._ssl_context if scheme == 'https' else None),
+            self.timeout)
+        return _Connection(reader, writer)
+
+    def _release(self, key, resp):
+        if resp.reusable:
+            self._idle[key].append(resp.conn)
+        else:
+            resp.conn.close()
+
+    async def _request(self, key, method, parsed):
+        conn = await self._connect(key)
+        path = parsed.path or '/'
+        if parsed.query:
+            path = f'{path}?{parsed.query}'
+        headers = {'Host': parsed.netloc, 'Connection': 'keep-alive',
+                   'Accept-Encoding': 'identity'}
+        headers.update(self.headers or {})
+        lines = [f'{method} {path} HTTP/1.1'] + \
+            [f'{k}: {v}' for k, v in headers.items()]
+        try:
+            conn.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+            await conn.writer.drain()
+            status_line = await asyncio.wait_for(
+                conn.reader.readline(), self.timeout)
+            if not status_line:
+                raise ConnectionResetError('connection closed by server')
+            status = int(status_line.split()[1])
+            resp_headers = {}
+            while True:
+                line = await asyncio.wait_for(conn.reader.readline(),
+                                              self.timeout)
+                if not line.strip():
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                resp_headers[name.strip().lower()] = value.strip()
+        except BaseException:
+            conn.close()
+            raise
+        return _Response(status, resp_headers, conn, timeout=self.timeout)
+
+    async def _write(self, f, data):
+        await asyncio.get_running_loop().run_in_executor(
+            self._file_executor, f.write, data)
+
+    async def _save(self, url, resp, save_path, pbar):
+        loop = asyncio.get_running_loop()
+        checksum = self.get_checksum(url)
+        hasher = hashlib.new(checksum[0]) if checksum else None
+        part_path = save_path + '.part'
+        f = await loop.run_in_executor(self._file_executor, open, part_path,
+                                       'wb')
+        try:
+            buffer = bytearray()
+            async for data in resp.stream(self.buffer_size):
+                if hasher:
+                    hasher.update(data)
+                buffer.extend(data)
+                pbar.update(len(data))
+                if len(buffer) >= WRITE_SIZE:
+                    await self._write(f, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await self._write(f, bytes(buffer))
+        finally:
+            await loop.run_in_executor(self._file_executor, f.close)
+        if hasher and hasher.hexdigest() != checksum[1]:
+            raise driver.ChecksumMismatch(url=url, algorithm=checksum[0],
+                                          actual=hasher.hexdigest(),
+                                          expected=checksum[1])
+        os.replace(part_path, save_path)
+
+    async def download_async(self, url):
+        file_name = os.path.basename(url)
+        save_path = self._get_save_path(url, file_name)
+        for _ in range(MAX_REDIRECTS + 1):
+            parsed = urllib_parse.urlsplit(url)
+            key = (parsed.scheme, parsed.hostname,
+                   parsed.port or (443 if parsed.scheme == 'https' else 80))
+            async with self._host_limit(key):
+                resp = await self._request(key, 'GET', parsed)
+                try:
+                    if resp.status in REDIRECT_STATUS and \
+                       resp.headers.get('location'):
+                        async for _ in resp.stream():
+                            pass
+                        url = urllib_parse.urljoin(url,
+                                                   resp.headers['location'])
+                        continue
+                    if resp.status != 200:
+                        resp.reusable = False
+                        raise DownloadFailed(url=url, status=resp.status)
+                    size = resp.headers.get('content-length')
+                    pbar = pbr.factory(int(size), description=file_name) \
+                        if self.progress and size else \
+                        pbr.NopProgressBar(size)
+                    try:
+                        await self._save(url, resp, save_path, pbar)
+                    finally:
+                        pbar.close()
+                    return file_name
+                except BaseException:
+                    resp.reusable = False
+                    raise
+                finally:
+                    self._release(key, resp)
+        raise DownloadFailed(url=url, status='too many redirects')
+
+    async def _download_url(self, url, limit):
+        async with limit:
+            LOG.debug('download %s to %s', url, self.download_dir)
+            for retries in range(self.checksum_retries, -1, -1):
+                try:
+                    return await self.download_async(url)
+                except driver.ChecksumMismatch as e:
+                    if retries:
+                        LOG.warning('%s, download again', e)
+                        continue
+                    LOG.error('download %s failed, %s', url, e)
+                except Exception as e:
+                    LOG.exception(e)
+                break
+            part_path = self._get_save_path(
+                url, os.path.basename(url)) + '.part'
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    async def download_urls_async(self, url_list):
+        if not os.path.exists(self.download_dir):
+            os.makedirs(self.download_dir)
+        limit = asyncio.Semaphore(self.workers)
+        self._file_executor = futures.ThreadPoolExecutor(self.write_workers)
+        try:
+            tasks = [asyncio.ensure_future(self._download_url(url, limit))
+                     for url in url_list]
+            for task in asyncio.as_completed(tasks):
+                LOG.debug('completed %s', await task)
+        finally:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+            self._host_limits.clear()
+            self._file_executor.shutdown(wait=True)
+
+    def download_urls(self, url_list, checksums=None, manifest=None):
+        """See BaseDownloadDriver.load_checksums for the checksums and
+        manifest
+        """
+        self.load_checksums(checksums=checksums, manifest=manifest)
+        asyncio.run(self.download_urls_async(url_list))
+
+    def download(self, url):
+        self.download_urls([url])
@@ -1,28 +1,311 @@
 import abc
+import collections
 from concurrent import futures
+import itertools
+import json
 import logging
+import os
+import re
+import threading
+from urllib import parse as urllib_parse
+
+from easy2use.common import exceptions
 
 LOG = logging.getLogger(__name__)
 DEFAULT_WORKERS = 10
+CACHE_FILE = '.download-cache.json'
+HASH_ALGORITHMS = {32: 'md5', 40: 'sha1', 64: 'sha256', 128: 'sha512'}
+BSD_CHECKSUM_REGEX = re.compile(r'^(\w+) \((.+)\) = ([0-9a-fA-F]+)$')
+
+
+class ChecksumMismatch(exceptions.BaseException):
+    _msg = '{algorithm} of {url} is {actual}, expected: {expected}'
+
+
+def parse_checksum(checksum):
+    """Return (algorithm, hexdigest) of a checksum, the algorithm is
+    guessed by the length if it is not specified, e.g.
+
+    >>> parse_checksum('sha1:2FD4E1C67A2D28FCED849EE1BB76E7391B93EB12')
+    ('sha1', '2fd4e1c67a2d28fced849ee1bb76e7391b93eb12')
+    """
+    algorithm, _, digest = checksum.strip().rpartition(':')
+    if not algorithm:
+        algorithm = HASH_ALGORITHMS.get(len(digest))
+        if not algorithm:
+            raise ValueError(f'unknown checksum {checksum}')
+    return algorithm.lower(), digest.lower()
+
+
+def parse_manifest(text):
+    """Return {file name: checksum} of a SHA256SUMS/MD5SUMS manifest, both
+    the GNU ('<digest>  <name>') and BSD ('SHA256 (<name>) = <digest>')
+    formats are supported.
+    """
+    checksums = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        matched = BSD_CHECKSUM_REGEX.match(line)
+        if matched:
+            algorithm, name, digest = matched.groups()
+            checksums[name] = f'{algorithm.lower()}:{digest}'
+            continue
+        digest, _, name = line.partition(' ')
+        checksums[name.strip().lstrip('*')] = digest
+    return checksums
+
+
+def get_host(url):
+    return urllib_parse.urlsplit(url).netloc
+
+
+def interleave_hosts(url_list):
+    """Reorder the urls so that the hosts take turns, e.g.
+
+    >>> interleave_hosts(['http://a/1', 'http://a/2', 'http://b/1'])
+    ['http://a/1', 'http://b/1', 'http://a/2']
+    """
+    hosts = collections.OrderedDict()
+    for url in url_list:
+        hosts.setdefault(get_host(url), []).append(url)
+    return [url for urls in itertools.zip_longest(*hosts.values())
+            for url in urls if url is not None]
+
+
+class HostSlots(object):
+    """Count the connections of every host, acquire() never blocks, e.g.
+
+    >>> slots = HostSlots(2)
+    >>> slots.acquire('a', 3)
+    2
+    >>> slots.acquire('a')
+    0
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self._used = collections.Counter()
+        self._lock = threading.Lock()
+
+    def acquire(self, host, count=1):
+        """Acquire at most count connections, return the acquired number"""
+        with self._lock:
+            if self.limit:
+                count = max(min(count, self.limit - self._used[host]), 0)
+            self._used[host] += count
+            return count
+
+    def release(self, host, count=1):
+        with self._lock:
+            self._used[host] -= count
+            if self._used[host] <= 0:
+                del self._used[host]
+
+
+class DownloadCache(object):
+    """Validators of the downloaded urls
+
+    For every url, the ETag, Last-Modified, size and sha256 of the
+    downloaded file are saved in a json file, so the next download of the
+    url can be a conditional request (If-None-Match/If-Modified-Since), and
+    the file is skipped if the server returns 304 Not Modified.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            self._data = {}
+
+    def get(self, url):
+        return self._data.get(url)
+
+    def conditional_headers(self, url, save_path):
+        """Return the conditional request headers, or {} if the url is not
+        cached or the local file does not match the cached size.
+        """
+        cached = self.get(url)
+        if not cached or not os.path.exists(save_path) or \
+           os.path.getsize(save_path) != cached.get('size'):
+            return {}
+        headers = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        return headers
+
+    def set(self, url, etag=None, last_modified=None, size=None,
+            sha256=None):
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._data[url] = {'etag': etag, 'last_modified': last_modified,
+                               'size': size, 'sha256': sha256}
+
+    def save(self):
+        with self._lock:
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._data, f)
+            os.replace(tmp_path, self.path)
 
 
 class BaseDownloadDriver(object):
 
     def __init__(self, download_dir=None, timeout=60, workers=None,
-                 progress=False, headers=None, keep_full_path=False):
+                 progress=False, headers=None, keep_full_path=False,
+                 cache=False, force=False, host_connections=None,
+                 checksum_retries=1):
+        """
+        Args:
+            cache (bool|str, optional): Use a DownloadCache, the cache file
+                defaults to `<download_dir>/.download-cache.json`.
+            force (bool, optional): Download all the urls even if they are
+                not modified.
+            host_connections (int, optional): The max number of concurrent
+                connections to one host.
+            checksum_retries (int, optional): Times to download a file again
+                if its checksum is mismatched. Defaults to 1.
+        """
         self.download_dir = download_dir or './'
         self.workers = workers or DEFAULT_WORKERS
         self.progress = progress
         self.timeout = timeout
         self.headers = headers
         self.keep_full_path = keep_full_path
+        self.force = force
+        self.host_connections = host_connections
+        self.host_slots = HostSlots(host_connections)
+        self.checksum_retries = checksum_retries
+        self.checksums = {}
+        self.cache = None
+        if cache:
+            self.cache = DownloadCache(
+                cache if isinstance(cache, str)
+                else os.path.join(self.download_dir, CACHE_FILE))
+
+    def read_manifest(self, manifest):
+        with open(manifest) as f:
+            return f.read()
+
+    def get_checksum(self, url):
+        """Return the expected (algorithm, hexdigest) of the url or None"""
+        checksum = self.checksums.get(url) or \
+            self.checksums.get(os.path.basename(urllib_parse.urlsplit(
+                url).path))
+        return parse_checksum(checksum) if checksum else None
+
+    def load_checksums(self, checksums=None, manifest=None):
+        """
+        Args:
+            checksums (dict, optional): The expected checksum of the urls or
+                file names, e.g. {'foo.iso': 'sha256:<hexdigest>'}, the
+                algorithm can be omitted.
+            manifest (str, optional): A checksum file, e.g. SHA256SUMS.
+        """
+        self.checksums = parse_manifest(self.read_manifest(manifest)) \
+            if manifest else {}
+        self.checksums.update(checksums or {})
+
+    def retry_mismatched(self, func, *args, **kwargs):
+        """Call func again if it raises ChecksumMismatch, at most
+        `checksum_retries` times, the last ChecksumMismatch is raised.
+        """
+        for retries in range(self.checksum_retries, -1, -1):
+            try:
+                return func(*args, **kwargs)
+            except ChecksumMismatch as e:
+                if not retries:
+                    raise
+                LOG.warning('%s, download again', e)
+
+    def download_urls(self, url_list, checksums=None, manifest=None):
+        """See load_checksums for the checksums and manifest"""
+        self.load_checksums(checksums=checksums, manifest=manifest)
+        try:
+            # the urls of one host are spread out, so that a slow host does
+            # not occupy all of the workers, an iterator (e.g. the urls from
+            # a crawler) is consumed lazily in its order.
+            if isinstance(url_list, (list, tuple)):
+                url_list = interleave_hosts(url_list)
+            for result in self.run_scheduled(self.download_url, url_list):
+                LOG.debug('completed %s', result)
+        finally:
+            if self.cache:
+                self.cache.save()
 
-    def download_urls(self, url_list):
-        with futures.ThreadPoolExecutor(self.workers) as executor:
-            results = executor.map(self.download_url, url_list)
+    def run_scheduled(self, fn, url_list):
+        """Call fn with the urls in the workers, yield the results in
+        completion order
+
+        The urls are dispatched in their order, but a url is held back while
+        its host has `host_connections` connections, and the next url of
+        the other hosts is dispatched instead, so no worker waits for a busy
+        host. The url_list is consumed lazily, only when no queued url can
+        be dispatched.
+        """
+        urls = iter(url_list)
+        # host -> [(sequence, url)], the hosts are scanned in the order of
+        # their first queued url
+        queues = collections.OrderedDict()
+        sequence = itertools.count()
+        running = set()
+        exhausted = False
+
+        def _call(host, url):
+            try:
+                return fn(url)
+            finally:
+                self.host_slots.release(host)
+
+        def _dispatch():
+            for host in sorted(queues, key=lambda h: queues[h][0][0]):
+                if self.host_slots.acquire(host):
+                    _, url = queues[host].popleft()
+                    if not queues[host]:
+                        del queues[host]
+                    return executor.submit(_call, host, url)
+            return None
+
+        executor = futures.ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while True:
+                while len(running) < self.workers:
+                    future = _dispatch()
+                    if future:
+                        running.add(future)
+                        continue
+                    url = None if exhausted else next(urls, None)
+                    if url is None:
+                        exhausted = True
+                        break
+                    queues.setdefault(get_host(url), collections.deque()) \
+                        .append((next(sequence), url))
+                if not running:
+                    return
+                done, running = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
-        for result in results:
-            LOG.debug('completed %s', result)
+    def _get_save_path(self, url, file_name):
+        if not self.keep_full_path:
+            return os.path.join(self.download_dir, file_name)
+        # TODO: Need to be rigorously tested.
+        splited = urllib_parse.urlsplit(url).path.split('/')
+        save_dir = os.path.join(self.download_dir,
+                                os.path.join(*splited[1:-1]))
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+        return os.path.join(save_dir, file_name)
 
     def download_url(self, url):
         LOG.debug('download %s to %s', url, self.download_dir)
@@ -0,0 +1,187 @@
+import codecs
+import logging
+import posixpath
+import re
+import threading
+from html import parser as html_parser
+from urllib import parse as urllib_parse
+
+import urllib3
+
+from easy2use.common import workers
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+PAGE_EXTENSIONS = ('', '.html', '.htm', '.shtml', '.xhtml', '.php', '.asp',
+                   '.aspx', '.jsp')
+READ_SIZE = 64 * 1024
+
+
+def normalize_url(url):
+    """Normalize the url, so that the same resource has the same url
+
+    >>> normalize_url('HTTP://Example.com:80/a/./b/../c?x=1#top')
+    'http://example.com/a/c?x=1'
+    """
+    parts = urllib_parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if ':' in netloc:
+        netloc = f'[{netloc}]'
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f'{netloc}:{parts.port}'
+    if parts.username:
+        auth = parts.username
+        if parts.password:
+            auth = f'{auth}:{parts.password}'
+        netloc = f'{auth}@{netloc}'
+    path = parts.path or '/'
+    if '.' in path:
+        normalized = posixpath.normpath(path)
+        if path.endswith('/') and normalized != '/':
+            normalized += '/'
+        path = normalized
+    return urllib_parse.urlunsplit((scheme, netloc, path, parts.query, ''))
+
+
+class LinkParser(html_parser.HTMLParser):
+    """Collect the href of <a> tags, the page can be fed by chunks
+
+    >>> parser = LinkParser()
+    >>> parser.feed('<a href="foo.iso">foo</a><a hr')
+    >>> parser.feed('ef="bar.iso">bar</a>')
+    >>> parser.links
+    ['foo.iso', 'bar.iso']
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self.base = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href:
+                self.links.append(href.strip())
+        elif tag == 'base' and self.base is None:
+            self.base = dict(attrs).get('href')
+
+
+class Crawler(object):
+    """Crawl the pages from a url and yield the links of files
+
+    Pages of the same depth are fetched concurrently with one shared
+    connection pool, and every page is parsed while it is being received.
+    A link is a page if its path ends with '/' or an extension in
+    PAGE_EXTENSIONS, otherwise it is a file, and only the files which
+    match `file_regex` are yielded. Every url is visited at most once
+    after it is normalized.
+
+    >>> crawler = Crawler(max_depth=2, file_regex=r'.*\\.iso$')
+    >>> driver.download_urls(crawler.crawl('http://mirrors.example.com/'))
+    """
+
+    def __init__(self, max_depth=1, same_host=True, file_regex=None,
+                 workers=None, headers=None, timeout=60, http=None):
+        """
+        Args:
+            max_depth (int, optional): The max depth of the pages, the links
+                of the start page are at depth 1. Defaults to 1.
+            same_host (bool, optional): Only follow the links of the host
+                of the start url. Defaults to True.
+            file_regex (str, optional): Regex of the file urls.
+            workers (int, optional): The number of concurrent requests.
+            http (urllib3.PoolManager, optional): Share the pool with a
+                driver.
+        """
+        self.max_depth = max_depth
+        self.same_host = same_host
+        self.file_regex = re.compile(file_regex) if file_regex else None
+        self.workers = workers or 10
+        self.http = http or urllib3.PoolManager(maxsize=self.workers,
+                                                headers=headers,
+                                                timeout=timeout)
+        self.pages = 0
+        self.files = 0
+        self._visited = set()
+        self._lock = threading.Lock()
+
+    def _visit(self, url):
+        """Return True if the url is not visited"""
+        with self._lock:
+            if url in self._visited:
+                return False
+            self._visited.add(url)
+            return True
+
+    def _is_page(self, url):
+        path = urllib_parse.urlsplit(url).path
+        return path.endswith('/') or \
+            posixpath.splitext(path)[1].lower() in PAGE_EXTENSIONS
+
+    def fetch_links(self, url):
+        """Fetch a page and return the absolute urls of its links"""
+        resp = self.http.request('GET', url, preload_content=False)
+        try:
+            content_type = resp.headers.get('Content-Type', 'text/html')
+            if resp.status != 200 or 'html' not in content_type:
+                LOG.warning('skip page %s, status: %s, type: %s',
+                            url, resp.status, content_type)
+                return []
+            charset = re.search(r'charset=([\w-]+)', content_type)
+            try:
+                decoder = codecs.getincrementaldecoder(
+                    charset.group(1) if charset else 'utf-8')('replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            parser = LinkParser()
+            for data in resp.stream(READ_SIZE):
+                parser.feed(decoder.decode(data))
+            parser.feed(decoder.decode(b'', final=True))
+            parser.close()
+        finally:
+            resp.release_conn()
+        base = urllib_parse.urljoin(url, parser.base or '')
+        return [urllib_parse.urljoin(base, link) for link in parser.links]
+
+    def _fetch(self, url):
+        try:
+            return self.fetch_links(url)
+        except Exception as e:
+            LOG.error('fetch page %s failed, %s', url, e)
+            return []
+
+    def crawl(self, url):
+        """Yield the urls of files, files are yielded while the other pages
+        are being fetched, so they can be downloaded at the same time.
+        """
+        url = normalize_url(url)
+        host = urllib_parse.urlsplit(url).netloc
+        self._visit(url)
+        pages = [url]
+        for depth in range(1, self.max_depth + 1):
+            next_pages = []
+            for links in workers.run_concurrent(self._fetch, maps=pages,
+                                                max_workers=self.workers,
+                                                ordered=False):
+                self.pages += 1
+                for link in links:
+                    link = normalize_url(link)
+                    parts = urllib_parse.urlsplit(link)
+                    if parts.scheme not in DEFAULT_PORTS or \
+                       (self.same_host and parts.netloc != host) or \
+                       not self._visit(link):
+                        continue
+                    if self._is_page(link):
+                        next_pages.append(link)
+                        continue
+                    if self.file_regex and not self.file_regex.match(link):
+                        continue
+                    self.files += 1
+                    yield link
+            LOG.debug('crawled %s pages of depth %s', len(pages), depth)
+            pages = next_pages
+            if not pages:
+                break
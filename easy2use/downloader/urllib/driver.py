@@ -1,25 +1,51 @@
-import io
+import hashlib
+from http import client as http_client
+import json
 import logging
 import os
 import re
+import threading
+import time
 import urllib3
-from urllib import parse as urllib_parse
 
 import bs4
 
 from easy2use.component import pbr
 from easy2use.common import exceptions
+from easy2use.common import workers
 from easy2use.downloader import driver
 
 LOG = logging.getLogger(__name__)
 
 FILE_NAME_MAX_SIZE = 50
+DEFAULT_SEGMENT_MIN_SIZE = 4 * 1024 * 1024
+PART_SUFFIX = '.part'
+STATE_SUFFIX = '.json'
+STATE_SAVE_INTERVAL = 1
+READ_SIZE = 1024 * 1024
+DEFAULT_BUFFER_SIZE = 64 * 1024
+MAX_BUFFER_SIZE = 1024 * 1024
+PROGRESS_INTERVAL = 0.1
+# a read which fills the buffer in less time does not wait for the network
+FAST_READ_TIME = 0.002
 
 
 class GetPageFailed(exceptions.BaseException):
     _msg = 'get web page failed, {error}'
 
 
+class RangeNotSatisfied(exceptions.BaseException):
+    _msg = 'request range {start}-{end} of {url} failed, status: {status}'
+
+
+class NotModified(exceptions.BaseException):
+    _msg = '{url} is not modified'
+
+
+class RequestFailed(exceptions.BaseException):
+    _msg = '{method} {url} failed, status: {status}'
+
+
 def find_links(url, link_regex=None, headers=None):
     """
     >>> links = find_links('http://www.baidu.com',
@@ -41,74 +67,623 @@ def find_links(url, link_regex=None, headers=None):
     return img_links
 
 
+class HeadInfo(object):
+
+    def __init__(self, url, size=None, accept_ranges=False, etag=None,
+                 last_modified=None):
+        self.url = url
+        self.size = size
+        self.accept_ranges = accept_ranges
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def validator(self):
+        """The strong ETag or the Last-Modified header"""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    @classmethod
+    def from_headers(cls, url, headers):
+        size = headers.get('Content-Length')
+        content_range = headers.get('Content-Range', '')
+        if '/' in content_range and not content_range.endswith('*'):
+            size = content_range.rpartition('/')[2]
+        return cls(url, size=int(size) if size else None,
+                   accept_ranges=headers.get('Accept-Ranges',
+                                             '').lower() == 'bytes',
+                   etag=headers.get('ETag'),
+                   last_modified=headers.get('Last-Modified'))
+
+
+class DownloadState(object):
+    """The progress of a partial download
+
+    It is saved as the sidecar `<file>.part.json` of `<file>.part`, and
+    records the url, size, validator and the [start, end, offset] of every
+    segment, so an interrupted download can be resumed with Range and
+    If-Range requests.
+    """
+
+    def __init__(self, path, url, size=None, validator=None,
+                 accept_ranges=False, segments=None, etag=None,
+                 last_modified=None):
+        self.path = path
+        self.url = url
+        self.size = size
+        self.validator = validator
+        self.accept_ranges = accept_ranges
+        self.segments = segments or []
+        self.etag = etag
+        self.last_modified = last_modified
+        self._saved_at = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path, info, ranges):
+        return cls(path, info.url, size=info.size, validator=info.validator,
+                   accept_ranges=info.accept_ranges,
+                   segments=[[start, end, start] for start, end in ranges],
+                   etag=info.etag, last_modified=info.last_modified)
+
+    @classmethod
+    def load(cls, path, url):
+        try:
+            with open(path + STATE_SUFFIX) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('url') != url:
+            return None
+        return cls(path, url, size=data.get('size'),
+                   validator=data.get('validator'),
+                   accept_ranges=data.get('accept_ranges', False),
+                   segments=data.get('segments'), etag=data.get('etag'),
+                   last_modified=data.get('last_modified'))
+
+    @property
+    def resumable(self):
+        return bool(self.accept_ranges and self.validator and
+                    self.completed_size)
+
+    @property
+    def completed_size(self):
+        return sum(offset - start for start, _, offset in self.segments)
+
+    def match(self, info):
+        return info.accept_ranges and info.validator == self.validator and \
+            info.size == self.size
+
+    def update(self, index, offset):
+        self.segments[index][2] = offset
+        if self.resumable and \
+           time.monotonic() - self._saved_at >= STATE_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            data = {'url': self.url, 'size': self.size,
+                    'validator': self.validator,
+                    'accept_ranges': self.accept_ranges,
+                    'segments': [list(s) for s in self.segments],
+                    'etag': self.etag, 'last_modified': self.last_modified}
+            tmp_path = f'{self.path}{STATE_SUFFIX}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path + STATE_SUFFIX)
+            self._saved_at = time.monotonic()
+
+    def remove(self):
+        with self._lock:
+            if os.path.exists(self.path + STATE_SUFFIX):
+                os.remove(self.path + STATE_SUFFIX)
+
+
+class InlineHasher(object):
+    """Hash a file in order while its segments are being written
+
+    update() is called after the data is written, the data at the hashed
+    offset is hashed directly, the data written ahead by the other segments
+    is read back (from the page cache) when the hashed offset reaches it,
+    so the file is never read again after it is downloaded.
+    """
+
+    def __init__(self, fd, state, algorithms):
+        self.fd = fd
+        self.state = state
+        self.hashers = {name: hashlib.new(name) for name in algorithms}
+        self.offset = 0
+        self._lock = threading.Lock()
+
+    def _hash(self, data):
+        for hasher in self.hashers.values():
+            hasher.update(data)
+        self.offset += len(data)
+
+    def _written_end(self):
+        for start, _, offset in self.state.segments:
+            if start <= self.offset < offset:
+                return offset
+        return self.offset
+
+    def _catch_up(self):
+        while True:
+            size = min(self._written_end() - self.offset, READ_SIZE)
+            if size <= 0:
+                return
+            data = os.pread(self.fd, size, self.offset)
+            if not data:
+                return
+            self._hash(data)
+
+    def update(self, offset, data):
+        with self._lock:
+            if offset == self.offset:
+                self._hash(data)
+            self._catch_up()
+
+    def hexdigest(self, algorithm):
+        with self._lock:
+            self._catch_up()
+            return self.hashers[algorithm].hexdigest()
+
+
 class Urllib3Driver(driver.BaseDownloadDriver):
 
     def __init__(self, headers=None, pool_maxsize: int = None,
-                 buffer_size: int = None,
-                 **kwargs):
+                 buffer_size: int = None, max_buffer_size: int = None,
+                 segments: int = None,
+                 segment_min_size: int = None, rate_limit: int = None,
+                 host_rate_limit: int = None,
+                 plan: bool = False, **kwargs):
         """URLlib3 downlad driver
 
         Args:
             headers (dict, optional): request headers. Defaults to None.
             pool_maxsize (int, optional): Request pool size. Defaults to None.
-            buffer_size (int, optional): Buffer size. Defaults to None.
+            buffer_size (int, optional): The initial read size, it is
+                doubled while the reads fill the buffer without waiting
+                for the network, and halved when they wait. Defaults to
+                64KB.
+            max_buffer_size (int, optional): The max read size. Defaults to
+                1MB.
+            segments (int, optional): Download a file with this number of
+                concurrent range requests if the server supports it.
+                Defaults to 1.
+            segment_min_size (int, optional): The minimum size of one
+                segment. Defaults to 4MB.
+            rate_limit (int, optional): The total bandwidth limit in bytes
+                per second.
+            host_rate_limit (int, optional): The bandwidth limit of every
+                host in bytes per second.
+            plan (bool, optional): Send HEAD requests for all of the urls
+                first, and download the largest files first. Defaults to
+                False.
         """
         super(Urllib3Driver, self).__init__(**kwargs)
         self.headers = headers
-        self.buffer_size = buffer_size or io.DEFAULT_BUFFER_SIZE
+        self.buffer_size = buffer_size or DEFAULT_BUFFER_SIZE
+        self.max_buffer_size = max(max_buffer_size or MAX_BUFFER_SIZE,
+                                   self.buffer_size)
+        self.segments = segments or 1
+        self.segment_min_size = segment_min_size or DEFAULT_SEGMENT_MIN_SIZE
         self.filename_length = 1
         self._mid_index = 1
-        self.http = urllib3.PoolManager(num_pools=self.workers,
-                                        maxsize=pool_maxsize or self.workers,
-                                        headers=self.headers,
-                                        timeout=self.timeout)
-
-    def download_urls(self, url_list):
-        self.filename_length = min(
-            *[len(os.path.basename(url)) for url in url_list],
-            FILE_NAME_MAX_SIZE)
+        self.host_rate_limit = host_rate_limit
+        self.plan = plan
+        self._multi_progress = None
+        self._planned = {}
+        self._bucket = rate_limit and workers.TokenBucket(rate_limit)
+        self._host_buckets = {}
+        self._host_lock = threading.Lock()
+        self.http = urllib3.PoolManager(
+            num_pools=self.workers,
+            maxsize=pool_maxsize or self.host_connections or
+            self.workers * self.segments,
+            headers=self.headers,
+            timeout=self.timeout)
+
+    def plan_urls(self, url_list):
+        """Send HEAD requests concurrently, return the urls sorted by size
+        from large to small (longest processing time first), the urls of
+        not modified files are removed.
+
+        The size of the urls which are failed to HEAD is unknown, and they
+        are scheduled at last.
+        """
+        order = {url: index for index, url in enumerate(url_list)}
+        infos = [info for info in self.run_scheduled(self._plan_url, url_list)
+                 if info]
+        self._planned = {info.url: info for info in infos}
+        planned = sorted(infos, key=lambda info: (-(info.size or -1),
+                                                  order[info.url]))
+        LOG.debug('planned %s urls, %s are not modified',
+                  len(planned), len(url_list) - len(planned))
+        return [info.url for info in planned]
+
+    def _plan_url(self, url):
+        save_path = self._get_save_path(url, os.path.basename(url))
+        state = self._load_state(url, save_path + PART_SUFFIX)
+        try:
+            return self._head(
+                url, headers=self._conditional_headers(url, save_path, state))
+        except NotModified:
+            LOG.info('%s is not modified, skip', url)
+            return None
+        except Exception as e:
+            LOG.warning('head %s failed, %s', url, e)
+            return HeadInfo(url)
+
+    def download_urls(self, url_list, **kwargs):
+        total = None
+        if self.plan and isinstance(url_list, (list, tuple)):
+            url_list = self.plan_urls(url_list)
+            if not url_list:
+                return
+            total = sum(self._planned[url].size or 0 for url in url_list)
+        if isinstance(url_list, (list, tuple)):
+            self.filename_length = min(
+                *[len(os.path.basename(url)) for url in url_list],
+                FILE_NAME_MAX_SIZE)
+        else:
+            self.filename_length = FILE_NAME_MAX_SIZE
         self._mid_index = max(int(self.filename_length / 2) - 2, 1)
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
-        super(Urllib3Driver, self).download_urls(url_list)
+        if self.plan and isinstance(url_list, (list, tuple)):
+            # an iterator is not interleaved by host, the planned order is
+            # kept
+            url_list = iter(url_list)
+        try:
+            if not self.progress or (isinstance(url_list, (list, tuple)) and
+                                     len(url_list) <= 1):
+                super(Urllib3Driver, self).download_urls(url_list, **kwargs)
+                return
+            # one aggregate progress instead of a bar for every file
+            self._multi_progress = pbr.MultiProgress(total=total)
+            try:
+                with self._multi_progress:
+                    super(Urllib3Driver, self).download_urls(url_list,
+                                                             **kwargs)
+            finally:
+                self._multi_progress = None
+        finally:
+            self._planned = {}
 
     def _format_description(self, message):
         return f'{message[:self._mid_index]}****{message[-self._mid_index:]}'
 
-    def download(self, url):
-        file_name = os.path.basename(url)
-        resp = self.http.request('GET', url, preload_content=False)
-        LOG.debug('get resp for url %s', url)
-        size = 'Content-Length' in resp.headers and \
-            int(resp.headers.get('Content-Length')) or None
+    def _host_bucket(self, url):
+        if not self.host_rate_limit:
+            return None
+        host = urllib3.util.parse_url(url).netloc
+        with self._host_lock:
+            if host not in self._host_buckets:
+                self._host_buckets[host] = workers.TokenBucket(
+                    self.host_rate_limit)
+            return self._host_buckets[host]
+
+    def _throttle(self, bucket, size):
+        if self._bucket:
+            self._bucket.consume(size)
+        if bucket:
+            bucket.consume(size)
+
+    def _request_headers(self, **kwargs):
+        headers = dict(self.headers or {})
+        headers.update(kwargs)
+        return headers
+
+    def _get(self, url, headers=None):
+        # urllib3 1.x returns EOF without error if the connection is closed
+        # before Content-Length bytes are read, unless it is enforced
+        return self.http.request(
+            'GET', url, preload_content=False, enforce_content_length=True,
+            headers=self._request_headers(**(headers or {})))
+
+    def head(self, url):
+        return self._head(url)
 
-        if self.progress and size:
+    def _head(self, url, headers=None):
+        resp = self.http.request(
+            'HEAD', url, headers=self._request_headers(**(headers or {})))
+        if resp.status == 304:
+            raise NotModified(url=url)
+        if resp.status != 200:
+            raise RequestFailed(method='HEAD', url=url, status=resp.status)
+        return HeadInfo.from_headers(url, resp.headers)
+
+    def _split_ranges(self, size):
+        segments = max(min(self.segments, size // self.segment_min_size), 1)
+        segment_size = -(-size // segments)
+        return [(start, min(start + segment_size, size) - 1)
+                for start in range(0, size, segment_size)]
+
+    def _get_pbar(self, file_name, size):
+        if self._multi_progress:
+            pbar = self._multi_progress.factory(size, description=file_name)
+        elif self.progress and size:
             pbar = pbr.factory(size)
             desc_template = f'{{:{self.filename_length}}}'
             pbar.set_description(
                 desc_template.format(self._format_description(file_name)))
         else:
             pbar = pbr.NopProgressBar(size)
+        return pbar
 
-        if not self.keep_full_path:
-            save_path = os.path.join(self.download_dir, file_name)
-        else:
-            # TODO: Need to be rigorously tested.
-            splited = urllib_parse.urlsplit(url).path.split('/')
-            save_dir = os.path.join(self.download_dir,
-                                    os.path.join(*splited[1:-1]))
-            if not os.path.exists(save_dir):
-                os.makedirs(save_dir)
-            save_path = os.path.join(save_dir, file_name)
+    def _get_reader(self, resp):
+        """Return the object to readinto
+
+        urllib3's readinto reads a new bytes object and copies it, so the
+        body is read from the http.client response directly if it is not
+        encoded, else from urllib3, e.g. to decode gzip.
+        """
+        raw = getattr(resp, '_fp', None)
+        if not resp.headers.get('Content-Encoding') and \
+           isinstance(raw, http_client.HTTPResponse):
+            return raw
+        return resp
+
+    def _write_stream(self, resp, fd, state, index, pbar, hasher=None):
+        start, end, offset = state.segments[index]
+        bucket = self._host_bucket(state.url)
+        reader = self._get_reader(resp)
+        buffer = memoryview(bytearray(self.max_buffer_size))
+        chunk_size = self.buffer_size
+        unreported, reported_at = 0, time.monotonic()
+        try:
+            while True:
+                read_at = time.monotonic()
+                size = reader.readinto(buffer[:chunk_size])
+                if not size:
+                    break
+                # the data is ready before it is read, read more at once,
+                # and read less if the reads wait for the network
+                if size == chunk_size and \
+                   time.monotonic() - read_at < FAST_READ_TIME:
+                    chunk_size = min(chunk_size * 2, self.max_buffer_size)
+                elif chunk_size > self.buffer_size:
+                    chunk_size //= 2
+                data = buffer[:size]
+                self._throttle(bucket, size)
+                os.pwrite(fd, data, offset)
+                state.update(index, offset + size)
+                if hasher:
+                    hasher.update(offset, data)
+                offset += size
+                unreported += size
+                if time.monotonic() - reported_at >= PROGRESS_INTERVAL:
+                    pbar.update(unreported)
+                    unreported, reported_at = 0, time.monotonic()
+            self._check_length(resp, reader, offset - start)
+        except Exception:
+            if reader is not resp:
+                # the connection is not reusable after a broken body
+                resp.close()
+            raise
+        finally:
+            pbar.update(unreported)
+        if end is not None and offset != end + 1:
+            raise RangeNotSatisfied(url=state.url, start=start, end=end,
+                                    status=f'got {offset - start} bytes')
+        return offset
+
+    def _check_length(self, resp, reader, size):
+        """http.client returns EOF without error if the connection is
+        closed before Content-Length bytes are read
+        """
+        length = resp.headers.get('Content-Length')
+        if reader is resp or not length or \
+           'chunked' in resp.headers.get('Transfer-Encoding', ''):
+            return
+        if size < int(length):
+            raise urllib3.exceptions.IncompleteRead(size, int(length) - size)
+
+    def _download_range(self, url, fd, state, index, pbar, hasher=None):
+        start, end, offset = state.segments[index]
+        if end is not None and offset > end:
+            return
+        headers = {'Range': f'bytes={offset}-{"" if end is None else end}'}
+        if state.validator:
+            headers['If-Range'] = state.validator
+        resp = self._get(url, headers=headers)
+        try:
+            if resp.status != 206:
+                raise RangeNotSatisfied(url=url, start=offset, end=end,
+                                        status=resp.status)
+            self._write_stream(resp, fd, state, index, pbar, hasher=hasher)
+        finally:
+            resp.release_conn()
+
+    def _download_segmented(self, url, fd, state, pbar, hasher=None):
+        pending = [index for index, (_, end, offset)
+                   in enumerate(state.segments)
+                   if end is None or offset <= end]
+        # the file holds one connection of the host, the other segments
+        # borrow the free connections, they are not waited for
+        host = driver.get_host(url)
+        borrowed = self.host_slots.acquire(host, len(pending) - 1)
+        LOG.debug('download %s with %s segments, %s connections',
+                  url, len(pending), borrowed + 1)
+        try:
+            for _ in workers.run_concurrent(
+                    lambda index: self._download_range(url, fd, state, index,
+                                                       pbar, hasher=hasher),
+                    maps=pending, max_workers=borrowed + 1):
+                pass
+        finally:
+            self.host_slots.release(host, borrowed)
+
+    def _download_stream(self, url, fd, state, pbar, resp, hasher=None):
         try:
-            with open(save_path, 'wb') as f:
-                for data in resp.stream(self.buffer_size):
-                    f.write(data)
-                    pbar.update(len(data))
+            offset = self._write_stream(resp, fd, state, 0, pbar,
+                                        hasher=hasher)
+        finally:
+            resp.release_conn()
+        # the file is preallocated by Content-Length, which is not the size
+        # of the decoded data if the content is encoded
+        os.ftruncate(fd, offset)
+
+    def _preallocate(self, fd, size):
+        if not size or not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError as e:
+            LOG.debug('preallocate failed, %s', e)
+
+    def _resume_stream(self, url, state):
+        """Request the rest of the file, return (resp, state), the state is
+        reset if the file is changed on the server.
+        """
+        offset = state.segments[0][2]
+        resp = self._get(url, headers={'Range': f'bytes={offset}-',
+                                       'If-Range': state.validator})
+        if resp.status not in (200, 206):
+            resp.release_conn()
+            raise RangeNotSatisfied(url=url, start=offset, end='',
+                                    status=resp.status)
+        if resp.status == 206:
+            LOG.info('resume %s from %s', url, offset)
+            return resp, state
+        LOG.info('%s is changed, download again', url)
+        info = HeadInfo.from_headers(url, resp.headers)
+        return resp, DownloadState.create(state.path, info, [(0, None)])
+
+    def _load_state(self, url, part_path):
+        state = DownloadState.load(part_path, url)
+        if state and not os.path.exists(part_path):
+            return None
+        return state
+
+    def _conditional_headers(self, url, save_path, state):
+        if not self.cache or self.force or state:
+            return {}
+        return self.cache.conditional_headers(url, save_path)
+
+    def _prepare(self, url, part_path, save_path):
+        """Return (resp, state), resp is None if the file should be
+        downloaded with segments. NotModified is raised if the cached file
+        is not modified.
+        """
+        state = self._load_state(url, part_path)
+        headers = self._conditional_headers(url, save_path, state)
+
+        if self.segments > 1:
+            # the HEAD response of the planning phase is used if any
+            info = self._planned.get(url)
+            if not info or info.size is None:
+                try:
+                    info = self._head(url, headers=headers)
+                except RequestFailed as e:
+                    # e.g. 405 or 403 of GET-only urls, GET decides
+                    LOG.debug('%s, download without segments', e)
+                    info = HeadInfo(url)
+            if state and not state.match(info):
+                state = None
+            if info.accept_ranges and info.size and \
+               info.size >= self.segment_min_size * 2:
+                return None, state or DownloadState.create(
+                    part_path, info, self._split_ranges(info.size))
+
+        if state and len(state.segments) == 1:
+            return self._resume_stream(url, state)
+
+        resp = self._get(url, headers=headers)
+        LOG.debug('get resp for url %s', url)
+        if resp.status != 200:
+            resp.release_conn()
+            if resp.status == 304:
+                raise NotModified(url=url)
+            raise RequestFailed(method='GET', url=url, status=resp.status)
+        info = HeadInfo.from_headers(url, resp.headers)
+        return resp, DownloadState.create(part_path, info, [(0, None)])
+
+    def _remove_part(self, part_path):
+        for path in (part_path, part_path + STATE_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _verify(self, url, hasher, checksum):
+        if not checksum:
+            return
+        algorithm, expected = checksum
+        actual = hasher.hexdigest(algorithm)
+        if actual != expected:
+            raise driver.ChecksumMismatch(url=url, algorithm=algorithm,
+                                          actual=actual, expected=expected)
+        LOG.debug('%s of %s is matched', algorithm, url)
+
+    def _download_file(self, url, file_name, save_path, part_path,
+                       checksum):
+        resp, state, pbar = None, None, None
+        algorithms = set([checksum[0]] if checksum else [])
+        if self.cache:
+            algorithms.add('sha256')
+        try:
+            resp, state = self._prepare(url, part_path, save_path)
+            pbar = self._get_pbar(file_name, state.size)
+            if state.completed_size:
+                pbar.update(state.completed_size)
+            flags = os.O_RDWR | os.O_CREAT
+            if not state.completed_size:
+                flags |= os.O_TRUNC
+            fd = os.open(part_path, flags, 0o644)
+            try:
+                hasher = InlineHasher(fd, state, algorithms) \
+                    if algorithms else None
+                self._preallocate(fd, state.size)
+                if resp is None:
+                    os.ftruncate(fd, state.size)
+                    self._download_segmented(url, fd, state, pbar,
+                                             hasher=hasher)
+                else:
+                    self._download_stream(url, fd, state, pbar, resp,
+                                          hasher=hasher)
+                self._verify(url, hasher, checksum)
+                sha256 = self.cache and hasher.hexdigest('sha256')
+            finally:
+                os.close(fd)
+            os.replace(part_path, save_path)
+            state.remove()
+            if self.cache:
+                self.cache.set(url, etag=state.etag,
+                               last_modified=state.last_modified,
+                               size=os.path.getsize(save_path),
+                               sha256=sha256)
+        except NotModified:
+            LOG.info('%s is not modified, skip', url)
+        except driver.ChecksumMismatch:
+            self._remove_part(part_path)
+            raise
         except Exception as e:
             LOG.error('download %s failed %s', file_name, e)
-            if os.path.exists(save_path):
-                os.remove(save_path)
+            if state and state.resumable:
+                state.save()
+            else:
+                self._remove_part(part_path)
         finally:
-            pbar.close()
-            return file_name
+            if pbar:
+                pbar.close()
+
+    def download(self, url):
+        file_name = os.path.basename(url)
+        save_path = self._get_save_path(url, file_name)
+        part_path = save_path + PART_SUFFIX
+        checksum = self.get_checksum(url)
+        try:
+            self.retry_mismatched(self._download_file, url, file_name,
+                                  save_path, part_path, checksum)
+        except driver.ChecksumMismatch as e:
+            LOG.error('download %s failed, %s', file_name, e)
+        return file_name
+
+    def read_manifest(self, manifest):
+        if not manifest.startswith(('http://', 'https://')):
+            return super(Urllib3Driver, self).read_manifest(manifest)
+        resp = self.http.request('GET', manifest)
+        if resp.status != 200:
+            raise GetPageFailed(error=f'get {manifest} failed, '
+                                      f'status: {resp.status}')
+        return resp.data.decode()
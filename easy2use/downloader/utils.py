@@ -1,18 +1,35 @@
 import argparse
 from urllib import parse as urllib_parse
+from easy2use.downloader.urllib import crawler as urllib_crawler
 from easy2use.downloader.urllib import driver as urllib_driver
 from easy2use.downloader.wget import driver as wget_driver
 
 
-def get_download_driver(use_wget=False, workers=None):
-    cls = use_wget and wget_driver.WgetDriver or urllib_driver.Urllib3Driver
-    return cls(progress=True, workers=workers)
+def get_download_driver(use_wget=False, workers=None, segments=None,
+                        force=False, rate_limit=None, host_rate_limit=None,
+                        host_connections=None, plan=False):
+    if use_wget:
+        return wget_driver.WgetDriver(progress=True, workers=workers)
+    return urllib_driver.Urllib3Driver(progress=True, workers=workers,
+                                       segments=segments, cache=True,
+                                       force=force, rate_limit=rate_limit,
+                                       host_rate_limit=host_rate_limit,
+                                       host_connections=host_connections,
+                                       plan=plan)
 
 
-def get_urls(url: str, direct=False, regex=None):
+def get_urls(url: str, direct=False, regex=None, depth=None, workers=None):
+    """Return the urls to download, if depth is specified, the pages are
+    crawled and a generator of the file urls is returned.
+    """
     if url.startswith('http://') or url.startswith('https://'):
         if direct:
             urls = [url]
+        elif depth:
+            crawler = urllib_crawler.Crawler(max_depth=depth,
+                                             file_regex=regex,
+                                             workers=workers)
+            urls = crawler.crawl(url)
         else:
             links = urllib_driver.find_links(url, link_regex=regex)
             urls = [urllib_parse.urljoin(url, link) for link in links]
@@ -22,9 +39,16 @@ def get_urls(url: str, direct=False, regex=None):
     return urls
 
 
-def download(urls, use_wget=False, workers=None):
-    downloader = get_download_driver(use_wget=use_wget, workers=workers)
-    downloader.download_urls(urls)
+def download(urls, use_wget=False, workers=None, segments=None,
+             force=False, rate_limit=None, host_rate_limit=None,
+             host_connections=None, manifest=None, plan=False):
+    downloader = get_download_driver(use_wget=use_wget, workers=workers,
+                                     segments=segments, force=force,
+                                     rate_limit=rate_limit,
+                                     host_rate_limit=host_rate_limit,
+                                     host_connections=host_connections,
+                                     plan=plan)
+    downloader.download_urls(urls, manifest=manifest)
 
 
 def main():
@@ -32,18 +56,47 @@ def main():
     parser.add_argument('url', help='Download path, url or file'),
     parser.add_argument('-r', '--regex', help='Url regex'),
     parser.add_argument('-w', '--workers', type=int, help='Download workers'),
+    parser.add_argument('-d', '--depth', type=int,
+                        help='Crawl the pages to this depth and download '
+                             'the files found'),
+    parser.add_argument('-s', '--segments', type=int,
+                        help='Download a file with N concurrent segments'),
+    parser.add_argument('--rate-limit', type=int,
+                        help='Total bandwidth limit (bytes/s)'),
+    parser.add_argument('--host-rate-limit', type=int,
+                        help='Bandwidth limit of every host (bytes/s)'),
+    parser.add_argument('--host-connections', type=int,
+                        help='Max concurrent connections of every host'),
+    parser.add_argument('--checksums',
+                        help='Verify the files with a checksum file or url, '
+                             'e.g. SHA256SUMS'),
+    parser.add_argument('--plan', action='store_true',
+                        help='Get the sizes of the files first, and download '
+                             'the largest files first'),
     parser.add_argument('--direct', action='store_true',
                         help='Download url direct')
     parser.add_argument('--wget', action='store_true', help='Use wget driver')
+    parser.add_argument('--force', action='store_true',
+                        help='Download the files even if they are not '
+                             'modified')
     args = parser.parse_args()
 
-    urls = get_urls(args.url, direct=args.direct, regex=args.regex)
-    if not urls:
+    urls = get_urls(args.url, direct=args.direct, regex=args.regex,
+                    depth=args.depth, workers=args.workers)
+    if isinstance(urls, list) and not urls:
         print('Nothing to do')
         return
 
-    download(urls, use_wget=args.wget, workers=args.workers)
-    print(f'Downloaded {len(urls)} link(s)')
+    download(urls, use_wget=args.wget, workers=args.workers,
+             segments=args.segments, force=args.force,
+             rate_limit=args.rate_limit,
+             host_rate_limit=args.host_rate_limit,
+             host_connections=args.host_connections,
+             manifest=args.checksums, plan=args.plan)
+    if isinstance(urls, list):
+        print(f'Downloaded {len(urls)} link(s)')
+    else:
+        print('Downloaded')
 
 
 if __name__ == '__main__':
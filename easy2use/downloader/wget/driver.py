@@ -1,18 +1,50 @@
+import hashlib
 import logging
 import os
 
 from easy2use.downloader import driver
 
 LOG = logging.getLogger(__name__)
+READ_SIZE = 1024 * 1024
+
+
+def hash_file(path, algorithm):
+    hasher = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(READ_SIZE), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
 
 
 class WgetDriver(driver.BaseDownloadDriver):
     WGET = '/usr/bin/wget'
 
     def download(self, url):
+        return self.retry_mismatched(self._download, url)
+
+    def _download(self, url):
         cmd = [self.WGET, url, '-P', self.download_dir, '--timeout',
                str(self.timeout)]
+        checksum = self.get_checksum(url)
+        if checksum:
+            # write to a known path, so that the file is verified rather
+            # than a renamed copy, e.g. foo.iso.1
+            save_path = self._get_save_path(url, os.path.basename(url))
+            cmd.extend(['-O', save_path])
         LOG.debug('Run cmd: %s', cmd)
         if not self.progress:
             cmd.append('-q')
         os.system(' '.join(cmd))
+        if checksum:
+            self._verify(url, save_path, checksum)
+
+    def _verify(self, url, save_path, checksum):
+        algorithm, expected = checksum
+        actual = hash_file(save_path, algorithm) \
+            if os.path.exists(save_path) else None
+        if actual != expected:
+            if actual is not None:
+                os.remove(save_path)
+            raise driver.ChecksumMismatch(url=url, algorithm=algorithm,
+                                          actual=actual, expected=expected)
+        LOG.debug('%s of %s is matched', algorithm, url)
@@ -1,13 +1,47 @@
+import asyncio
+import codecs
+import contextlib
 from concurrent import futures
+import functools
+import importlib
+import itertools
 import logging
+import os
+import multiprocessing
+import queue
+import re
+import resource
+import selectors
+import shlex
+import signal
 import sys
 import locale
 import subprocess
+import tempfile
+import threading
+import time
+import uuid
 from collections import namedtuple
 
+from multiprocessing import reduction
+
+from easy2use.common import exceptions
+from easy2use.common import table
+from easy2use.common import workers
+
 LOG = logging.getLogger(__name__)
 
 ExecuteResult = namedtuple('ExecutorResult', 'status stdout stderr')
+ResourceUsage = namedtuple('ResourceUsage',
+                           'wall_time user_time sys_time max_rss '
+                           'output_bytes')
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+READ_SIZE = 64 * 1024
+MAX_LINE_SIZE = 1024 * 1024
+DEFAULT_SPOOL_SIZE = 1024 * 1024
+WORKER_JOIN_TIMEOUT = 5
 
 
 def read_stream(stream):
@@ -21,10 +55,152 @@ def read_stream(stream):
     return ''.join(lines)
 
 
+class AccountedResult(ExecuteResult):
+    """ExecuteResult with the ResourceUsage of the command
+
+    It is still equal to the (status, stdout, stderr) tuple, the usage is
+    available by the `usage` attribute.
+    """
+
+    def __new__(cls, status, stdout, stderr, usage=None):
+        result = super().__new__(cls, status, stdout, stderr)
+        result.usage = usage
+        return result
+
+
+def wait_with_usage(popen, deadline=None):
+    """Wait the process with os.wait4 and return its rusage
+
+    The returncode of popen is set, subprocess.TimeoutExpired is raised if
+    the process is still running at the deadline.
+    """
+    if deadline is None:
+        _, status, rusage = os.wait4(popen.pid, 0)
+    else:
+        interval = 0.0005
+        while True:
+            pid, status, rusage = os.wait4(popen.pid, os.WNOHANG)
+            if pid:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(popen.args, 0)
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, 0.05)
+    popen.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+def kill_process_group(popen, sig=signal.SIGKILL):
+    """Kill the process and its children, the process must be started with
+    start_new_session=True.
+    """
+    try:
+        os.killpg(popen.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+class ExecuteStream(object):
+    """Run command and iterate its output as (stream, line) events
+
+    Stdout and stderr are drained concurrently with selectors, so the child
+    never blocks on a full pipe. A line longer than MAX_LINE_SIZE is
+    yielded in pieces, so the memory is bounded. If the timeout is reached,
+    the whole process group is killed and ExecuteTimeout is raised.
+    e.g.
+    >>> stream = ExecuteStream('ls -l; ls /not-exists')
+    >>> for name, line in stream:
+    >>>     print(name, line, end='')
+    >>> stream.returncode
+    2
+    """
+
+    def __init__(self, cmd, timeout=None, encoding=None):
+        self.cmd = ' '.join(cmd) if isinstance(cmd, list) else cmd
+        self.timeout = timeout
+        self.encoding = encoding or locale.getpreferredencoding()
+        self.popen = None
+        self.usage = None
+
+    @property
+    def returncode(self):
+        return self.popen.returncode if self.popen else None
+
+    def __iter__(self):
+        LOG.debug('Execute: %s', self.cmd)
+        start = time.monotonic()
+        deadline = start + self.timeout if self.timeout else None
+        output_bytes = 0
+        self.popen = subprocess.Popen(self.cmd, shell=True,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE,
+                                      start_new_session=True)
+        selector = selectors.DefaultSelector()
+        selector.register(self.popen.stdout, selectors.EVENT_READ, STDOUT)
+        selector.register(self.popen.stderr, selectors.EVENT_READ, STDERR)
+        buffers = {STDOUT: bytearray(), STDERR: bytearray()}
+        # a multibyte character may be split by a piece of a long line
+        decoders = {
+            name: codecs.getincrementaldecoder(self.encoding)('replace')
+            for name in buffers}
+        try:
+            while selector.get_map():
+                remaining = None
+                if deadline:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise exceptions.ExecuteTimeout(cmd=self.cmd,
+                                                        timeout=self.timeout)
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fd, READ_SIZE)
+                    buffer, decoder = buffers[key.data], decoders[key.data]
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        line = decoder.decode(bytes(buffer), final=True)
+                        if line:
+                            yield key.data, line
+                        continue
+                    output_bytes += len(data)
+                    # only the new data is searched, the unfinished line is
+                    # not scanned again
+                    end = data.rfind(b'\n') + 1
+                    if end:
+                        buffer += data[:end]
+                        lines = decoder.decode(bytes(buffer)).split('\n')
+                        buffer.clear()
+                        for line in itertools.islice(lines, len(lines) - 1):
+                            yield key.data, line + '\n'
+                    buffer += data[end:]
+                    if len(buffer) >= MAX_LINE_SIZE:
+                        line = decoder.decode(bytes(buffer))
+                        buffer.clear()
+                        if line:
+                            yield key.data, line
+            try:
+                rusage = wait_with_usage(self.popen, deadline)
+            except subprocess.TimeoutExpired:
+                raise exceptions.ExecuteTimeout(cmd=self.cmd,
+                                                timeout=self.timeout)
+            # ru_maxrss is in kilobytes on Linux
+            self.usage = ResourceUsage(time.monotonic() - start,
+                                       rusage.ru_utime, rusage.ru_stime,
+                                       rusage.ru_maxrss * 1024, output_bytes)
+        finally:
+            selector.close()
+            if self.popen.poll() is None:
+                kill_process_group(self.popen)
+                self.popen.wait()
+            self.popen.stdout.close()
+            self.popen.stderr.close()
+        LOG.debug('Return: %s', self.popen.returncode)
+
+
 class LinuxExecutor(object):
 
     @staticmethod
-    def execute(cmd, stdout_file=None, stderr_file=None, console=False):
+    def execute(cmd, stdout_file=None, stderr_file=None, console=False,
+                timeout=None, on_stdout=None, on_stderr=None):
         """ execute linux command
         e.g.
         >>> LinuxExecutor.execute('ls -l')
@@ -36,25 +212,709 @@ class LinuxExecutor(object):
             cmd.append('2>>{0}'.format(stderr_file))
 
         if console:
-            stdout, stderr = sys.stdout, sys.stderr
-        else:
-            stdout, stderr = subprocess.PIPE, subprocess.PIPE
-
-        LOG.debug('Execute: %s', ' '.join(cmd))
-        p = subprocess.Popen(' '.join(cmd), shell=True,
-                             stdout=stdout, stderr=stderr)
-        out = read_stream(p.stdout)
-        err = read_stream(p.stderr)
-        p.communicate()
+            LOG.debug('Execute: %s', ' '.join(cmd))
+            start = time.monotonic()
+            p = subprocess.Popen(' '.join(cmd), shell=True,
+                                 stdout=sys.stdout, stderr=sys.stderr)
+            try:
+                rusage = wait_with_usage(p, timeout and start + timeout)
+            except subprocess.TimeoutExpired:
+                p.kill()
+                p.wait()
+                raise exceptions.ExecuteTimeout(cmd=' '.join(cmd),
+                                                timeout=timeout)
+            usage = ResourceUsage(time.monotonic() - start, rusage.ru_utime,
+                                  rusage.ru_stime, rusage.ru_maxrss * 1024, 0)
+            return AccountedResult(p.returncode, '', '', usage=usage)
+
+        out, err = [], []
+        callbacks = {STDOUT: (out.append, on_stdout),
+                     STDERR: (err.append, on_stderr)}
+        stream = ExecuteStream(cmd, timeout=timeout)
+        for name, line in stream:
+            append, callback = callbacks[name]
+            append(line)
+            if callback:
+                callback(line)
+        out, err = ''.join(out), ''.join(err)
         LOG.debug('Stdout: %s, Stderr: %s', out, err)
-        return ExecuteResult(p.returncode, ''.join(out), ''.join(err))
+        return AccountedResult(stream.returncode, out, err, usage=stream.usage)
+
+    @staticmethod
+    def execute_stream(cmd, timeout=None):
+        """Execute linux command and iterate (stream, line) events
+        e.g.
+        >>> for name, line in LinuxExecutor.execute_stream('ls -l'):
+        >>>     print(name, line, end='')
+        """
+        return ExecuteStream(cmd, timeout=timeout)
+
+    @staticmethod
+    def execute_spooled(cmd, timeout=None, max_memory=None):
+        """Execute linux command, the stdout and stderr of the result are
+        file objects, and they are rolled over to temporary files once their
+        size exceeds max_memory.
+        e.g.
+        >>> result = LinuxExecutor.execute_spooled('cat big.log')
+        >>> for line in result.stdout:
+        >>>     print(line, end='')
+        """
+        max_memory = max_memory or DEFAULT_SPOOL_SIZE
+        files = {STDOUT: tempfile.SpooledTemporaryFile(max_memory, mode='w+'),
+                 STDERR: tempfile.SpooledTemporaryFile(max_memory, mode='w+')}
+        stream = ExecuteStream(cmd, timeout=timeout)
+        try:
+            for name, line in stream:
+                files[name].write(line)
+        except BaseException:
+            for f in files.values():
+                f.close()
+            raise
+        for f in files.values():
+            f.seek(0)
+        return AccountedResult(stream.returncode, files[STDOUT],
+                               files[STDERR], usage=stream.usage)
+
+    @staticmethod
+    def session(shell='/bin/sh'):
+        """Return a ShellSession which reuses one shell for many commands
+        e.g.
+        >>> with LinuxExecutor.session() as session:
+        >>>     session.execute('ls -l')
+        """
+        return ShellSession(shell=shell)
+
+
+class ShellSession(object):
+    """A long-lived shell which executes commands one by one
+
+    Commands are written to the stdin of the shell, and the output of each
+    command is delimited by sentinel markers, which avoids fork/exec of a
+    new shell for every command. Commands share the state of the shell,
+    e.g. `cd` and `export` affect the following commands.
+    e.g.
+    >>> with ShellSession() as session:
+    >>>     session.execute('cd /tmp')
+    >>>     session.execute('pwd')
+    ExecutorResult(status=0, stdout='/tmp\\n', stderr='')
+    """
+
+    def __init__(self, shell='/bin/sh', encoding=None):
+        self.shell = shell
+        self.encoding = encoding or locale.getpreferredencoding()
+        self.marker = f'__EASY2USE_{uuid.uuid4().hex}__'
+        self._stdout_end = re.compile(
+            '\n{} (\\d+)\n'.format(self.marker).encode())
+        self._stderr_end = '\n{}\n'.format(self.marker).encode()
+        self._lock = threading.Lock()
+        self.popen = None
+
+    def start(self):
+        if self.popen and self.popen.poll() is None:
+            return
+        LOG.debug('start shell session: %s', self.shell)
+        self.popen = subprocess.Popen([self.shell], stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE,
+                                      start_new_session=True)
+
+    def close(self):
+        if not self.popen:
+            return
+        if self.popen.poll() is None:
+            with contextlib.suppress(OSError):
+                self.popen.stdin.close()
+            try:
+                self.popen.wait(1)
+            except subprocess.TimeoutExpired:
+                kill_process_group(self.popen)
+                self.popen.wait()
+        for pipe in (self.popen.stdin, self.popen.stdout, self.popen.stderr):
+            with contextlib.suppress(OSError):
+                pipe.close()
+        self.popen = None
+
+    def _script(self, cmd):
+        # the command is quoted and evaluated, so that an unbalanced quote
+        # or a syntax error returns a non-zero status instead of breaking
+        # the script (`command` keeps the shell from exiting on the error)
+        return ('{{ command eval {cmd}\n}} </dev/null\n'
+                'printf "\\n%s %d\\n" {marker} $?\n'
+                'printf "\\n%s\\n" {marker} >&2\n').format(
+                    cmd=shlex.quote(cmd),
+                    marker=self.marker).encode(self.encoding)
+
+    def _read_until_markers(self, cmd, timeout):
+        deadline = time.monotonic() + timeout if timeout else None
+        buffers = {STDOUT: bytearray(), STDERR: bytearray()}
+        selector = selectors.DefaultSelector()
+        selector.register(self.popen.stdout, selectors.EVENT_READ, STDOUT)
+        selector.register(self.popen.stderr, selectors.EVENT_READ, STDERR)
+        status = None
+        try:
+            while selector.get_map():
+                remaining = None
+                if deadline:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise exceptions.ExecuteTimeout(cmd=cmd,
+                                                        timeout=timeout)
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fd, READ_SIZE)
+                    if not data:
+                        raise exceptions.ShellSessionExited(cmd=cmd)
+                    buffer = buffers[key.data]
+                    # only the new data and the tail which may hold the
+                    # beginning of the marker are searched
+                    pos = max(len(buffer) - len(self.marker) - 16, 0)
+                    buffer.extend(data)
+                    if key.data == STDOUT:
+                        matched = self._stdout_end.search(buffer, pos)
+                        if matched:
+                            status = int(matched.group(1))
+                            del buffer[matched.start():]
+                            selector.unregister(key.fileobj)
+                    elif buffer.endswith(self._stderr_end):
+                        del buffer[-len(self._stderr_end):]
+                        selector.unregister(key.fileobj)
+        finally:
+            selector.close()
+        return status, buffers[STDOUT], buffers[STDERR]
+
+    def execute(self, cmd, timeout=None):
+        cmd = ' '.join(cmd) if isinstance(cmd, list) else cmd
+        with self._lock:
+            self.start()
+            LOG.debug('Execute in session: %s', cmd)
+            try:
+                self.popen.stdin.write(self._script(cmd))
+                self.popen.stdin.flush()
+                status, out, err = self._read_until_markers(cmd, timeout)
+            except BrokenPipeError:
+                self.close()
+                raise exceptions.ShellSessionExited(cmd=cmd)
+            except BaseException:
+                # the state of the shell is unknown, start a new one
+                self.close()
+                raise
+        return ExecuteResult(status,
+                             out.decode(self.encoding, errors='replace'),
+                             err.decode(self.encoding, errors='replace'))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+
+class ShellSessionPool(object):
+    """A small pool of ShellSession for concurrent callers
+
+    >>> pool = ShellSessionPool(size=4)
+    >>> pool.execute('hostname')
+    """
+
+    def __init__(self, size=4, **kwargs):
+        self.size = size
+        self._sessions = queue.LifoQueue()
+        for _ in range(size):
+            self._sessions.put(ShellSession(**kwargs))
+
+    def execute(self, cmd, timeout=None):
+        session = self._sessions.get()
+        try:
+            return session.execute(cmd, timeout=timeout)
+        finally:
+            self._sessions.put(session)
+
+    def close(self):
+        for _ in range(self.size):
+            self._sessions.get().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+
+class AsyncBatchExecutor(object):
+    """Run many short commands on asyncio subprocesses
+
+    At most `concurrency` commands run at the same time. A command of list
+    type is executed directly by create_subprocess_exec, and a command of
+    str type is executed by the shell.
+    e.g.
+    >>> batch = AsyncBatchExecutor(concurrency=20, timeout=10)
+    >>> for result in batch.run([['hostname'], 'uname -r']):
+    >>>     print(result.status, result.stdout)
+    """
+
+    def __init__(self, concurrency=10, timeout=None, encoding=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.encoding = encoding or locale.getpreferredencoding()
+
+    async def _create_subprocess(self, cmd):
+        kwargs = {'stdout': asyncio.subprocess.PIPE,
+                  'stderr': asyncio.subprocess.PIPE,
+                  'start_new_session': True}
+        if isinstance(cmd, str):
+            return await asyncio.create_subprocess_shell(cmd, **kwargs)
+        return await asyncio.create_subprocess_exec(*cmd, **kwargs)
+
+    async def execute(self, cmd, timeout=None):
+        timeout = timeout or self.timeout
+        LOG.debug('Execute: %s', cmd)
+        start = time.monotonic()
+        process = await self._create_subprocess(cmd)
+        try:
+            out, err = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            raise exceptions.ExecuteTimeout(cmd=cmd, timeout=timeout)
+        finally:
+            if process.returncode is None:
+                kill_process_group(process)
+                await process.wait()
+        # the child is reaped by asyncio, so its rusage is not available
+        usage = ResourceUsage(time.monotonic() - start, None, None, None,
+                              len(out) + len(err))
+        return AccountedResult(process.returncode,
+                               out.decode(self.encoding, errors='replace'),
+                               err.decode(self.encoding, errors='replace'),
+                               usage=usage)
 
+    async def iter_completed(self, cmds, return_exceptions=False):
+        """Yield (index, result) as the commands complete"""
+        semaphore = asyncio.Semaphore(self.concurrency)
 
-def run_processes(func, maps=None, max_workers=1, nums=None):
-    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        if maps:
-            tasks = executor.map(func, maps)
-        elif nums:
-            tasks = [executor.submit(func) for _ in range(nums)]
-        for future in futures.as_completed(tasks):
+        async def _execute(index, cmd):
+            async with semaphore:
+                try:
+                    return index, await self.execute(cmd)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    return index, e
+
+        tasks = [asyncio.ensure_future(_execute(index, cmd))
+                 for index, cmd in enumerate(cmds)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def execute_many(self, cmds, ordered=True,
+                           return_exceptions=False):
+        """Return results in submission order, or in completion order if
+        ordered is False.
+        """
+        cmds = list(cmds)
+        results = [None] * len(cmds) if ordered else []
+        async for index, result in self.iter_completed(
+                cmds, return_exceptions=return_exceptions):
+            if ordered:
+                results[index] = result
+            else:
+                results.append(result)
+        return results
+
+    def run(self, cmds, ordered=True, return_exceptions=False):
+        """Synchronous version of execute_many, it must not be called from a
+        running event loop.
+        """
+        return asyncio.run(self.execute_many(
+            cmds, ordered=ordered, return_exceptions=return_exceptions))
+
+
+class TaskFailed(exceptions.BaseException):
+    _msg = 'task failed with item {item!r}: {error!r}'
+
+    def __init__(self, item=None, error=None):
+        super().__init__(item=item, error=error)
+        self.item = item
+        self.error = error
+
+    def __reduce__(self):
+        return self.__class__, (self.item, self.error)
+
+
+def _call_without_args(func, _):
+    return func()
+
+
+def _run_chunk(func, chunk, with_usage=False):
+    results = []
+    for item in chunk:
+        if with_usage:
+            start = time.monotonic()
+            before = resource.getrusage(resource.RUSAGE_SELF)
+        try:
+            result = func(item)
+        except Exception as e:
+            raise TaskFailed(item=item, error=e)
+        if with_usage:
+            after = resource.getrusage(resource.RUSAGE_SELF)
+            # the output of a function is unknown, and ru_maxrss is the
+            # peak of the worker process in kilobytes
+            result = (result, ResourceUsage(
+                time.monotonic() - start, after.ru_utime - before.ru_utime,
+                after.ru_stime - before.ru_stime, after.ru_maxrss * 1024,
+                None))
+        results.append(result)
+    return results
+
+
+def _iter_chunks(iterable, chunksize):
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, chunksize))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, chunksize))
+
+
+def run_processes(func, maps=None, max_workers=1, nums=None, chunksize=1,
+                  ordered=False, max_inflight=None, initializer=None,
+                  initargs=(), with_usage=False):
+    """Map func over maps (or call func nums times) in worker processes
+
+    Items are sent to the workers in chunks of `chunksize` to reduce the
+    IPC overhead, and at most `max_inflight` chunks (defaults to twice
+    max_workers) are submitted at the same time, so the input is consumed
+    lazily. Results are yielded in input order if ordered is True, else in
+    completion order. If func raises, the pending chunks are cancelled and
+    TaskFailed with the failing item is raised. If with_usage is True,
+    (result, ResourceUsage) of every item is yielded, its output_bytes is
+    None.
+    e.g.
+    >>> for result in run_processes(pow2, maps=range(10 ** 7),
+    ...                             max_workers=4, chunksize=1000):
+    ...     print(result)
+    """
+    if maps is not None:
+        items = maps
+    elif nums:
+        items = range(nums)
+        func = functools.partial(_call_without_args, func)
+    else:
+        return
+    executor = futures.ProcessPoolExecutor(max_workers=max_workers,
+                                           initializer=initializer,
+                                           initargs=initargs)
+    for future in workers.iter_completed(
+            executor, functools.partial(_run_chunk, func,
+                                        with_usage=with_usage),
+            _iter_chunks(items, chunksize), max_inflight or max_workers * 2,
+            ordered=ordered):
+        yield from future.result()
+
+
+class UsageReport(object):
+    """Aggregate the ResourceUsage of a batch of commands
+
+    e.g.
+    >>> report = UsageReport()
+    >>> for cmd in cmds:
+    >>>     report.add(cmd, LinuxExecutor.execute(cmd))
+    >>> print(report.dumps(top=10))
+    """
+    RANK_KEYS = ('cpu_time', 'wall_time', 'user_time', 'sys_time', 'max_rss',
+                 'output_bytes')
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, cmd, result):
+        usage = getattr(result, 'usage', None)
+        if usage is None:
+            LOG.warning('no usage for command: %s', cmd)
+            return
+        cmd = ' '.join(cmd) if isinstance(cmd, list) else cmd
+        self.records.append((cmd, usage))
+
+    @staticmethod
+    def _value(usage, key):
+        if key == 'cpu_time':
+            if usage.user_time is None:
+                return 0
+            return usage.user_time + usage.sys_time
+        return getattr(usage, key) or 0
+
+    def rank(self, key='cpu_time', top=None):
+        """Return [(cmd, usage), ...] sorted by the cost in descending order
+        """
+        if key not in self.RANK_KEYS:
+            raise ValueError(f'rank key must be one of {self.RANK_KEYS}')
+        ranked = sorted(self.records, key=lambda r: self._value(r[1], key),
+                        reverse=True)
+        return ranked[:top] if top else ranked
+
+    def total(self):
+        return {key: sum(self._value(usage, key)
+                         for _, usage in self.records)
+                for key in self.RANK_KEYS if key != 'max_rss'}
+
+    def dumps(self, key='cpu_time', top=None):
+        st = table.SimpleTable()
+        st.set_header(['Command', 'Wall(s)', 'User(s)', 'Sys(s)',
+                       'MaxRSS(KB)', 'Output(B)'])
+        for cmd, usage in self.rank(key=key, top=top):
+            st.add_row([cmd,
+                        f'{usage.wall_time:.3f}',
+                        f'{self._value(usage, "user_time"):.3f}',
+                        f'{self._value(usage, "sys_time"):.3f}',
+                        str(self._value(usage, 'max_rss') // 1024),
+                        str(self._value(usage, 'output_bytes'))])
+        return st.dumps()
+
+
+class WorkerLost(exceptions.BaseException):
+    _msg = 'worker {pid} exited unexpectedly'
+
+
+def _worker_main(conn, preload, initializer, initargs, max_tasks,
+                 max_memory):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module in preload:
+        importlib.import_module(module)
+    if initializer:
+        initializer(*initargs)
+    tasks = 0
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        func, args, kwargs = task
+        before = resource.getrusage(resource.RUSAGE_SELF)
+        try:
+            ok, result = True, func(*args, **kwargs)
+        except Exception as e:
+            ok, result = False, e
+        after = resource.getrusage(resource.RUSAGE_SELF)
+        tasks += 1
+        # ru_maxrss is in kilobytes on Linux
+        max_rss = after.ru_maxrss * 1024
+        retire = bool((max_tasks and tasks >= max_tasks) or
+                      (max_memory and max_rss >= max_memory))
+        usage = (max_rss, retire, after.ru_utime - before.ru_utime,
+                 after.ru_stime - before.ru_stime)
+        try:
+            data = reduction.ForkingPickler.dumps((ok, result) + usage)
+        except Exception as e:
+            data = reduction.ForkingPickler.dumps(
+                (False, TypeError(f'cannot pickle the result: {e}')) + usage)
+        conn.send_bytes(data)
+        if retire:
+            break
+    conn.close()
+
+
+class _Worker(object):
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.stats = {'index': index, 'pid': None, 'tasks': 0,
+                      'total_tasks': 0, 'failed': 0, 'restarts': 0,
+                      'busy_time': 0.0, 'user_time': 0.0, 'sys_time': 0.0,
+                      'max_rss': 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _start_process(self):
+        self.conn, child_conn = self.pool.mp_context.Pipe()
+        self.process = self.pool.mp_context.Process(
+            target=_worker_main,
+            args=(child_conn, self.pool.preload, self.pool.initializer,
+                  self.pool.initargs, self.pool.max_tasks,
+                  self.pool.max_memory),
+            daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.stats.update(pid=self.process.pid, tasks=0, max_rss=0)
+        LOG.debug('worker-%s started, pid=%s', self.index, self.process.pid)
+
+    def _join_process(self):
+        self.process.join(WORKER_JOIN_TIMEOUT)
+        if self.process.is_alive():
+            LOG.warning('kill worker-%s, pid=%s', self.index,
+                        self.process.pid)
+            self.process.kill()
+            self.process.join()
+
+    def _stop_process(self):
+        with contextlib.suppress(OSError):
+            self.conn.send(None)
+        self._join_process()
+        self.conn.close()
+
+    def _restart_process(self):
+        self._join_process()
+        self.conn.close()
+        self.stats['restarts'] += 1
+        self._start_process()
+
+    def start(self):
+        self._start_process()
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.pool._tasks.get()
+            if item is None:
+                break
+            future, task = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.monotonic()
+            # the task is pickled first, a task which can not be pickled
+            # fails alone, the worker is still waiting for a task
+            try:
+                data = reduction.ForkingPickler.dumps(task)
+            except Exception as e:
+                self.stats['failed'] += 1
+                future.set_exception(e)
+                continue
+            try:
+                self.conn.send_bytes(data)
+                data = self.conn.recv_bytes()
+                (ok, result, max_rss, retire,
+                 user_time, sys_time) = reduction.ForkingPickler.loads(data)
+            except (EOFError, OSError) as e:
+                LOG.warning('worker-%s lost: %s', self.index, e)
+                self.stats['failed'] += 1
+                future.set_exception(WorkerLost(pid=self.process.pid))
+                self._restart_process()
+                continue
+            wall_time = time.monotonic() - start
+            # the usage of the task, e.g. for UsageReport.add(name, future)
+            future.usage = ResourceUsage(wall_time, user_time, sys_time,
+                                         max_rss, len(data))
+            self.stats['busy_time'] += wall_time
+            self.stats['user_time'] += user_time
+            self.stats['sys_time'] += sys_time
+            self.stats['tasks'] += 1
+            self.stats['total_tasks'] += 1
+            self.stats['max_rss'] = max_rss
+            if ok:
+                future.set_result(result)
+            else:
+                self.stats['failed'] += 1
+                future.set_exception(result)
+            if retire:
+                LOG.debug('recycle worker-%s, pid=%s, tasks=%s, rss=%s',
+                          self.index, self.process.pid, self.stats['tasks'],
+                          max_rss)
+                self._restart_process()
+        self._stop_process()
+
+
+class WorkerPool(object):
+    """A long-lived pool of worker processes
+
+    Unlike run_processes, the workers are started once and reused by every
+    submit, and the `preload` modules are imported when the workers start.
+    A worker is replaced after `max_tasks` tasks or when its peak RSS
+    reaches `max_memory` bytes. The ResourceUsage of a task is set to the
+    `usage` attribute of its future, the output_bytes is the size of the
+    pickled result.
+    e.g.
+    >>> pool = WorkerPool(workers=4, preload=['json'], max_tasks=1000)
+    >>> pool.handle_signals()
+    >>> future = pool.submit(pow, 2, 10)
+    >>> future.result()
+    1024
+    >>> pool.shutdown()
+    """
+
+    def __init__(self, workers=None, preload=None, initializer=None,
+                 initargs=(), max_tasks=None, max_memory=None,
+                 mp_context=None):
+        self.workers = workers or os.cpu_count()
+        self.preload = list(preload or [])
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory
+        self.mp_context = mp_context or multiprocessing.get_context()
+        self._tasks = queue.SimpleQueue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def start(self):
+        with self._lock:
+            if self._workers:
+                return
+            for index in range(self.workers):
+                worker = _Worker(self, index)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, func, *args, **kwargs):
+        if self._shutdown:
+            raise RuntimeError('cannot submit after shutdown')
+        self.start()
+        future = futures.Future()
+        self._tasks.put((future, (func, args, kwargs)))
+        return future
+
+    def map(self, func, iterable):
+        tasks = [self.submit(func, item) for item in iterable]
+        for future in tasks:
             yield future.result()
+
+    def stats(self):
+        return [dict(worker.stats) for worker in self._workers]
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+        if cancel_futures:
+            with contextlib.suppress(queue.Empty):
+                while True:
+                    item = self._tasks.get_nowait()
+                    if item:
+                        item[0].cancel()
+        for _ in self._workers:
+            self._tasks.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.thread.join()
+
+    def handle_signals(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        """Shutdown the pool when receiving the signals, then call the
+        previous handler, if the previous handler is SIG_DFL, it is restored
+        and the signal is raised again, e.g. the process is terminated by
+        SIGTERM. It must be called from the main thread.
+        """
+        def _handler(signum, frame):
+            LOG.info('catch signal %s, shutdown worker pool', signum)
+            self.shutdown(cancel_futures=True)
+            previous = previous_handlers.get(signum)
+            if previous == signal.SIG_DFL:
+                signal.signal(signum, signal.SIG_DFL)
+                signal.raise_signal(signum)
+            elif callable(previous):
+                previous(signum, frame)
+
+        previous_handlers = {sig: signal.signal(sig, _handler)
+                             for sig in signals}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.shutdown()
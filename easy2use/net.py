@@ -5,12 +5,17 @@ import socket
 
 from easy2use import executor
 from easy2use import system
+from easy2use.common import workers
 
 ScanResult = namedtuple('ScanResult', 'host port connectable')
 
 
-def port_scan(host, port_start=0, port_end=65535, threads=1, callback=None):
+def port_scan(host, port_start=0, port_end=65535, threads=1, callback=None,
+              rate=None):
     """scan host ports between [port_start, port_end]
+    The callback is called with the done future of every port, and the
+    ScanResult list is returned in completion order. If `rate` is set, at
+    most `rate` ports are connected per second.
 
     >>> port_scan('localhost',
     ...           port_start=8001,
@@ -30,12 +35,15 @@ def port_scan(host, port_start=0, port_end=65535, threads=1, callback=None):
         finally:
             server.close()
 
-    with futures.ThreadPoolExecutor(threads) as executor:
-        for port in range(port_start, port_end + 1):
-            if callback:
-                executor.submit(_connect, port).add_done_callback(callback)
-            else:
-                executor.submit(_connect, port)
+    results = []
+    for future in workers.iter_completed(
+            futures.ThreadPoolExecutor(threads), _connect,
+            range(port_start, port_end + 1), threads * 2, ordered=False,
+            limiter=workers.RateLimiter(rate) if rate else None):
+        if callback:
+            callback(future)
+        results.append(future.result())
+    return results
 
 
 def ping(host):
@@ -1,49 +1,498 @@
+import array
+import bisect
+import collections
+import itertools
+import math
+import struct
+import time
 
-class LastNList(object):
+
+class RingBuffer(object):
+    """A fixed-capacity ring buffer
+
+    Appending is O(1), when the buffer is full the oldest item is
+    overwritten. If typecode is specified, e.g. 'd' for float or 'q' for int,
+    items are stored in an array.array instead of a list of Python objects,
+    so a window of one million floats only costs 8 MB.
+
+    >>> buffer = RingBuffer(3, typecode='d')
+    >>> buffer.extend([1, 2, 3, 4])
+    >>> list(buffer)
+    [2.0, 3.0, 4.0]
+    >>> buffer[-1]
+    4.0
+    """
+
+    def __init__(self, capacity, typecode=None):
+        if capacity <= 0:
+            raise ValueError('capacity must be greater than 0')
+        self.capacity = capacity
+        self.typecode = typecode
+        if typecode:
+            self._data = array.array(typecode, [0]) * capacity
+        else:
+            self._data = [None] * capacity
+        self._start = 0
+        self._len = 0
+
+    def append(self, item):
+        end = self._start + self._len
+        if self._len < self.capacity:
+            self._len += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+        self._data[end % self.capacity] = item
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def is_full(self):
+        return self._len == self.capacity
+
+    def _position(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('ring buffer index out of range')
+        return (self._start + index) % self.capacity
+
+    def __getitem__(self, index):
+        return self._data[self._position(index)]
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        end = self._start + self._len
+        return itertools.chain(
+            itertools.islice(self._data, self._start, min(end, self.capacity)),
+            itertools.islice(self._data, 0, max(end - self.capacity, 0)))
+
+    def segments(self):
+        """Return the items as at most two memoryview (or list) segments in
+        order, which avoids copying the items.
+        """
+        data = memoryview(self._data) if self.typecode else self._data
+        end = self._start + self._len
+        if end <= self.capacity:
+            return [data[self._start:end]]
+        return [data[self._start:], data[:end - self.capacity]]
+
+    def to_list(self):
+        return list(self)
+
+    def clear(self):
+        self._start = 0
+        self._len = 0
+
+    def __str__(self):
+        return str(self.to_list())
+
+
+class LastNList(RingBuffer):
     """A list structure that keeps the latest N arrays
     Always save at most N items. when adding the N+1th item, the oldest item
     will be discarded.
     E.g.
 
     >>> l = LastNList(2)
-    >>> l.put(1)
-    >>> l.put(2)
+    >>> l.append(1)
+    >>> l.append(2)
     >>> l.all()
     [1, 2]
-    >>> l.put(3)
+    >>> l.append(3)
     >>> l.all()
     [2, 3]
-    >>> l.put(4)
+    >>> l.append(4)
     >>> l.all()
     [3, 4]
     """
 
-    def __init__(self, size, reserve=None):
+    def __init__(self, size, reserve=None, typecode=None):
         """
-        By default, one time of the specified size is reserved
+        The reserve argument is kept for compatibility, items are stored in
+        a RingBuffer, so no extra space is reserved.
         """
+        super().__init__(size, typecode=typecode)
         self.size = size
-        self._data = []
-        self._index = 0
-        self.reserve = reserve if (reserve and reserve >= self.size) \
-            else self.size * 2
-
-    def append(self, item):
-        if len(self._data) >= self.reserve:
-            del self._data[:self._index + 1]
-            self._index = 0
-        elif len(self._data) >= self.size:
-            self._index += 1
-        self._data.append(item)
+        self.reserve = reserve
 
     def get(self, index=None):
-        return self._data[self._index + index]
+        return self[index]
 
     def all(self):
-        return self._data[self._index:]
+        return self.to_list()
 
     def clean(self):
-        del self._data[:]
+        self.clear()
 
-    def __str__(self):
-        return str(self.all())
+
+class SortedBlocks(object):
+    """A sorted list of values stored in blocks of `load` to 2 * `load`
+    values
+
+    add and remove bisect the max values of the blocks and only move the
+    values of one block, rather than the whole list like bisect.insort on a
+    list, and the value at an index is found by walking the block sizes.
+
+    >>> values = SortedBlocks()
+    >>> for value in [3, 1, 2]:
+    ...     values.add(value)
+    >>> values[0], values[-1], len(values)
+    (1, 3, 3)
+    """
+
+    def __init__(self, load=512):
+        if load < 2:
+            raise ValueError('load must be at least 2')
+        self.load = load
+        self._blocks = []
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._blocks)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('SortedBlocks index out of range')
+        for block in self._blocks:
+            if index < len(block):
+                return block[index]
+            index -= len(block)
+
+    def _split(self, index):
+        block = self._blocks[index]
+        if len(block) > self.load * 2:
+            self._blocks[index:index + 1] = [block[:self.load],
+                                             block[self.load:]]
+            self._maxes[index:index + 1] = [block[self.load - 1], block[-1]]
+
+    def add(self, value):
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+        else:
+            index = bisect.bisect_left(self._maxes, value)
+            if index == len(self._blocks):
+                index -= 1
+                self._blocks[index].append(value)
+                self._maxes[index] = value
+            else:
+                bisect.insort(self._blocks[index], value)
+            self._split(index)
+        self._len += 1
+
+    def remove(self, value):
+        index = bisect.bisect_left(self._maxes, value)
+        block = self._blocks[index] if index < len(self._blocks) else []
+        position = bisect.bisect_left(block, value)
+        if position == len(block) or block[position] != value:
+            raise ValueError(f'{value} is not in SortedBlocks')
+        del block[position]
+        self._len -= 1
+        if len(block) >= self.load // 2 and block:
+            self._maxes[index] = block[-1]
+        elif len(self._blocks) > 1:
+            # merge the small block into its neighbour
+            index = index - 1 if index else index
+            merged = self._blocks[index] + self._blocks[index + 1]
+            self._blocks[index:index + 2] = [merged]
+            self._maxes[index:index + 2] = [merged[-1]]
+            self._split(index)
+        elif block:
+            self._maxes[index] = block[-1]
+        else:
+            self._blocks, self._maxes = [], []
+
+
+class RollingStats(object):
+    """Statistics over the latest `size` samples and/or the samples of the
+    latest `window` seconds
+
+    count, sum, mean and variance are updated in O(1), min and max are kept
+    by monotonic deques, and the samples are also kept in SortedBlocks, so
+    percentiles never sort the whole window, and adding to a large window
+    does not move all of its samples.
+
+    >>> stats = RollingStats(size=1000, window=60)
+    >>> stats.add(0.12)
+    >>> stats.mean, stats.max, stats.percentile(99)
+    """
+
+    def __init__(self, size=None, window=None, clock=None):
+        if not size and not window:
+            raise ValueError('size or window is required')
+        self.size = size
+        self.window = window
+        self.clock = clock or time.monotonic
+        self._samples = collections.deque()
+        self._sorted = SortedBlocks()
+        self._min = collections.deque()
+        self._max = collections.deque()
+        self._seq = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._sum = 0.0
+
+    def add(self, value, timestamp=None):
+        timestamp = self.clock() if timestamp is None else timestamp
+        self._expire(timestamp)
+        if self.size and len(self._samples) >= self.size:
+            self._evict()
+        self._seq += 1
+        self._samples.append((self._seq, timestamp, value))
+        self._sorted.add(value)
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((self._seq, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((self._seq, value))
+
+        self._sum += value
+        delta = value - self._mean
+        self._mean += delta / len(self._samples)
+        self._m2 += delta * (value - self._mean)
+
+    def _evict(self):
+        seq, _, value = self._samples.popleft()
+        self._sorted.remove(value)
+        if self._min[0][0] == seq:
+            self._min.popleft()
+        if self._max[0][0] == seq:
+            self._max.popleft()
+
+        self._sum -= value
+        count = len(self._samples)
+        if not count:
+            self._mean = self._m2 = self._sum = 0.0
+            return
+        delta = value - self._mean
+        self._mean -= delta / count
+        self._m2 = max(self._m2 - delta * (value - self._mean), 0.0)
+
+    def _expire(self, now=None):
+        if not self.window:
+            return
+        expired_at = (self.clock() if now is None else now) - self.window
+        while self._samples and self._samples[0][1] <= expired_at:
+            self._evict()
+
+    @property
+    def count(self):
+        self._expire()
+        return len(self._samples)
+
+    @property
+    def sum(self):
+        self._expire()
+        return self._sum
+
+    @property
+    def mean(self):
+        self._expire()
+        return self._mean if self._samples else None
+
+    @property
+    def variance(self):
+        """The population variance"""
+        self._expire()
+        return self._m2 / len(self._samples) if self._samples else None
+
+    @property
+    def stdev(self):
+        variance = self.variance
+        return None if variance is None else math.sqrt(variance)
+
+    @property
+    def min(self):
+        self._expire()
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self):
+        self._expire()
+        return self._max[0][1] if self._max else None
+
+    def percentile(self, percent):
+        """Return the percentile with linear interpolation, e.g.
+        percentile(99) for p99.
+        """
+        if not 0 <= percent <= 100:
+            raise ValueError('percent must be between 0 and 100')
+        self._expire()
+        if not len(self._sorted):
+            return None
+        rank = (len(self._sorted) - 1) * percent / 100
+        lower = math.floor(rank)
+        upper = min(lower + 1, len(self._sorted) - 1)
+        return self._sorted[lower] + \
+            (self._sorted[upper] - self._sorted[lower]) * (rank - lower)
+
+    def summary(self, percents=(50, 90, 99)):
+        self._expire()
+        summary = {'count': self.count, 'sum': self.sum, 'mean': self.mean,
+                   'stdev': self.stdev, 'min': self.min, 'max': self.max}
+        for percent in percents:
+            summary[f'p{percent}'] = self.percentile(percent)
+        return summary
+
+
+def _write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class QuantileSketch(object):
+    """A mergeable quantile sketch with log-scaled buckets
+
+    A value v is counted in bucket ceil(log(v, gamma)), where
+    gamma = (1 + relative_error) / (1 - relative_error), so any quantile is
+    returned with at most `relative_error` relative error, and the memory
+    only depends on the range of the values (about 2000 buckets from 1us to
+    1 hour with 1% error), not on the number of samples. Values must be
+    non-negative.
+
+    record() does not take a lock, use one sketch per thread and merge them,
+    sketches from other processes can be merged after dumps()/loads().
+
+    >>> sketch = QuantileSketch(relative_error=0.01)
+    >>> for latency in latencies:
+    >>>     sketch.record(latency)
+    >>> sketch.quantile(0.99)
+    """
+    VERSION = 1
+    HEADER = struct.Struct('<BdQQdd')
+
+    def __init__(self, relative_error=0.01):
+        if not 0 < relative_error < 1:
+            raise ValueError('relative error must be between 0 and 1')
+        self.relative_error = relative_error
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self._log_gamma = math.log(self.gamma)
+        self._buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def record(self, value, count=1):
+        if value < 0:
+            raise ValueError(f'value must not be negative, got {value}')
+        self.count += count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value == 0:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self._buckets[index] = self._buckets.get(index, 0) + count
+
+    def _bucket_value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Return the q-quantile, e.g. quantile(0.999) for p999"""
+        if not 0 <= q <= 1:
+            raise ValueError('q must be between 0 and 1')
+        if not self.count:
+            return None
+        if q == 0:
+            return self.min
+        if q == 1:
+            return self.max
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0
+        seen = self.zero_count
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen > rank:
+                value = self._bucket_value(index)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def quantiles(self, qs):
+        return {q: self.quantile(q) for q in qs}
+
+    def merge(self, other):
+        if other.relative_error != self.relative_error:
+            raise ValueError('can not merge sketches with different '
+                             'relative error')
+        for index, count in other._buckets.items():
+            self._buckets[index] = self._buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def __len__(self):
+        return self.count
+
+    def dumps(self):
+        """Serialize the sketch to compact bytes, the bucket indexes are
+        delta and zigzag encoded as varints.
+        """
+        buffer = bytearray(self.HEADER.pack(
+            self.VERSION, self.relative_error, self.count, self.zero_count,
+            self.min, self.max))
+        _write_varint(buffer, len(self._buckets))
+        last = 0
+        for index in sorted(self._buckets):
+            delta = index - last
+            _write_varint(buffer, (delta << 1) ^ (delta >> 63))
+            _write_varint(buffer, self._buckets[index])
+            last = index
+        return bytes(buffer)
+
+    @classmethod
+    def loads(cls, data):
+        (version, relative_error, count, zero_count,
+         min_value, max_value) = cls.HEADER.unpack_from(data)
+        if version != cls.VERSION:
+            raise ValueError(f'unsupported sketch version {version}')
+        sketch = cls(relative_error=relative_error)
+        sketch.count, sketch.zero_count = count, zero_count
+        sketch.min, sketch.max = min_value, max_value
+        offset = cls.HEADER.size
+        size, offset = _read_varint(data, offset)
+        index = 0
+        for _ in range(size):
+            zigzag, offset = _read_varint(data, offset)
+            index += (zigzag >> 1) ^ -(zigzag & 1)
+            sketch._buckets[index], offset = _read_varint(data, offset)
+        return sketch
+
+    def to_fields(self, percents=(50, 90, 99, 99.9)):
+        """Return fields for InfluxDBClient.write, e.g.
+        {'count': 100, 'min': 1, 'max': 9, 'p50': 5, 'p99.9': 9, ...}
+        """
+        if not self.count:
+            return {'count': 0}
+        fields = {'count': self.count, 'min': self.min, 'max': self.max}
+        for percent in percents:
+            fields[f'p{percent}'] = self.quantile(percent / 100)
+        return fields
@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+import ddt
+
+from easy2use.common import exceptions
+from easy2use.common import retry
+
+
+@ddt.ddt
+class BackoffTestCases(unittest.TestCase):
+
+    def test_exponential_without_jitter(self):
+        backoff = retry.ExponentialBackoff(base=1, cap=10, jitter=None)
+        self.assertEqual([backoff(i) for i in range(5)], [1, 2, 4, 8, 10])
+
+    @ddt.data('full', 'decorrelated')
+    def test_exponential_with_jitter(self, jitter):
+        backoff = retry.ExponentialBackoff(base=1, cap=10, jitter=jitter)
+        previous = None
+        for attempt in range(20):
+            previous = backoff(attempt, previous)
+            self.assertLessEqual(previous, 10)
+            self.assertGreaterEqual(previous, 0)
+
+    def test_invalid_jitter(self):
+        self.assertRaises(ValueError, retry.ExponentialBackoff, jitter='foo')
+
+
+@mock.patch('time.sleep')
+class RetryTestCases(unittest.TestCase):
+
+    def test_retry_for_exceptions(self, mock_sleep):
+        func = mock.Mock(side_effect=[KeyError(), ValueError(), 'ok'])
+        result = retry.retry_for(func, finish_func=lambda r: r == 'ok',
+                                 retry_exceptions=[KeyError, ValueError])
+        self.assertEqual(result, 'ok')
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    def test_retry_for_not_retry(self, mock_sleep):
+        func = mock.Mock(side_effect=[TypeError()])
+        self.assertRaises(TypeError, retry.retry_for, func,
+                          retry_exceptions=[KeyError, ValueError])
+
+    def test_retry_decorator(self, mock_sleep):
+        func = mock.Mock(side_effect=[ValueError(), ValueError(), 'ok'])
+        decorated = retry.retry(retry_exceptions=(ValueError,),
+                                max_attempts=3)(func)
+        self.assertEqual(decorated(), 'ok')
+        func.side_effect = [ValueError()] * 3
+        self.assertRaises(ValueError, decorated)
+
+    def test_retry_budget(self, mock_sleep):
+        budget = retry.RetryBudget(ratio=0.5, min_per_second=0)
+        func = mock.Mock(side_effect=ValueError())
+        for _ in range(4):
+            self.assertRaises(ValueError, retry.retry_call, func,
+                              retry_exceptions=(ValueError,),
+                              max_attempts=3, budget=budget)
+        # 4 requests allow 2 retries in total
+        self.assertEqual(func.call_count, 6)
+
+
+class CircuitBreakerTestCases(unittest.TestCase):
+
+    def test_circuit_breaker(self):
+        breaker = retry.CircuitBreaker(failure_threshold=2,
+                                       recovery_timeout=0.05)
+        func = mock.Mock(side_effect=ValueError())
+        decorated = breaker(func)
+        for _ in range(2):
+            self.assertRaises(ValueError, decorated)
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertRaises(exceptions.CircuitOpen, decorated)
+        self.assertEqual(func.call_count, 2)
+
+        with mock.patch('time.monotonic', return_value=10 ** 9):
+            self.assertEqual(breaker.state, breaker.HALF_OPEN)
+            func.side_effect = None
+            func.return_value = 'ok'
+            self.assertEqual(decorated(), 'ok')
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+
+class AsyncRetryTestCases(unittest.TestCase):
+
+    def test_async_retry_for(self):
+        func = mock.AsyncMock(side_effect=[ValueError(), 1, 2])
+        result = asyncio.run(retry.async_retry_for(
+            func, interval=0.01, finish_func=lambda r: r == 2,
+            retry_exceptions=ValueError))
+        self.assertEqual(result, 2)
+        self.assertEqual(func.await_count, 3)
+
+    def test_async_retry_untile_true_timeout(self):
+        func = mock.Mock(return_value=False)
+        self.assertRaises(exceptions.RetryTimeout, asyncio.run,
+                          retry.async_retry_untile_true(func, interval=0.01,
+                                                        timeout=0.05))
+
+    def test_async_retry_for_hung_attempt(self):
+        async def hung():
+            await asyncio.sleep(10)
+
+        start = time.monotonic()
+        self.assertRaises(exceptions.RetryTimeout, asyncio.run,
+                          retry.async_retry_untile_true(hung, timeout=0.05))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_async_retry_for_cancel(self):
+        async def main():
+            task = asyncio.ensure_future(retry.async_retry_for(
+                mock.Mock(return_value=False), interval=10))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await task
+
+        self.assertRaises(asyncio.CancelledError, asyncio.run, main())
+
+    def test_async_retry_decorator(self):
+        func = mock.AsyncMock(side_effect=[ValueError(), 'ok'])
+        decorated = retry.async_retry(
+            retry_exceptions=(ValueError,),
+            backoff=retry.FixedBackoff(0.01))(func)
+        self.assertEqual(asyncio.run(decorated()), 'ok')
+
+    def test_hedged_call(self):
+        delays = [1, 0.01]
+
+        async def request():
+            await asyncio.sleep(delays.pop(0))
+            return 'ok'
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            result = await retry.hedged_call(request, delay=0.02)
+            return result, loop.time() - start
+
+        result, cost = asyncio.run(main())
+        self.assertEqual(result, 'ok')
+        self.assertLess(cost, 0.5)
+
+    def test_hedged_call_failed(self):
+        func = mock.AsyncMock(side_effect=[ValueError(), 'ok'])
+        self.assertRaises(ValueError, asyncio.run,
+                          retry.hedged_call(func, delay=0.01))
+        self.assertEqual(func.await_count, 1)
+
+    def test_hedged_call_all_failed(self):
+        attempts = [(0.05, KeyError()), (0, ValueError())]
+
+        async def request():
+            delay, error = attempts.pop(0)
+            await asyncio.sleep(delay)
+            raise error
+
+        self.assertRaises(KeyError, asyncio.run,
+                          retry.hedged_call(request, delay=0.01))
+        self.assertEqual(attempts, [])
+
+
+class PollSchedulerTestCases(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.scheduler = retry.PollScheduler()
+
+    def tearDown(self) -> None:
+        self.scheduler.stop()
+
+    def test_wait(self):
+        check = mock.Mock(side_effect=[False, False, True])
+        future = self.scheduler.wait(check, interval=0.01)
+        self.assertTrue(future.result(timeout=1))
+        self.assertEqual(check.call_count, 3)
+
+    def test_many_waiters(self):
+        counters = [0] * 100
+
+        def _check(index):
+            counters[index] += 1
+            return counters[index] >= 3
+
+        waiters = [self.scheduler.wait(_check, args=(i,), interval=0.01)
+                   for i in range(100)]
+        self.assertTrue(all(f.result(timeout=5) for f in waiters))
+        self.assertEqual(counters, [3] * 100)
+
+    def test_finish_func_and_error(self):
+        future = self.scheduler.wait(mock.Mock(return_value='active'),
+                                     finish_func=lambda r: r == 'active')
+        self.assertEqual(future.result(timeout=1), 'active')
+        future = self.scheduler.wait(mock.Mock(side_effect=ValueError()))
+        self.assertRaises(ValueError, future.result, timeout=1)
+
+    def test_timeout(self):
+        future = self.scheduler.wait(mock.Mock(return_value=False),
+                                     interval=0.01, timeout=0.05)
+        self.assertRaises(exceptions.RetryTimeout, future.result, timeout=1)
+
+    def test_workers_and_stop(self):
+        scheduler = retry.PollScheduler(workers=2)
+        check = mock.Mock(return_value=False)
+        future = scheduler.wait(check, interval=10)
+        retry.retry_untile_true(lambda: check.called, interval=0.01,
+                                timeout=1)
+        scheduler.stop()
+        self.assertTrue(future.cancelled())
+
+    def test_stop_while_checking(self):
+        for workers in (None, 2):
+            scheduler = retry.PollScheduler(workers=workers)
+            checking = threading.Event()
+
+            def _check():
+                checking.set()
+                time.sleep(0.1)
+                return False
+
+            future = scheduler.wait(_check, interval=0.01)
+            checking.wait(1)
+            scheduler.stop()
+            self.assertTrue(future.cancelled())
@@ -0,0 +1,108 @@
+from concurrent import futures
+import threading
+import time
+import unittest
+
+from easy2use.common import workers
+
+
+class RunConcurrentTestCases(unittest.TestCase):
+
+    def test_ordered(self):
+        def _slow_first(num):
+            time.sleep(0.05 if num == 0 else 0)
+            return num * 2
+
+        results = workers.run_concurrent(_slow_first, maps=iter(range(10)),
+                                         max_workers=4)
+        self.assertEqual(list(results), [i * 2 for i in range(10)])
+
+    def test_unordered(self):
+        def _slow_first(num):
+            time.sleep(0.1 if num == 0 else 0)
+            return num
+
+        results = list(workers.run_concurrent(_slow_first, maps=range(3),
+                                              max_workers=3, ordered=False))
+        self.assertEqual(results[-1], 0)
+        self.assertEqual(sorted(results), [0, 1, 2])
+
+    def test_nums(self):
+        results = workers.run_concurrent(lambda: 'foo', nums=3)
+        self.assertEqual(list(results), ['foo'] * 3)
+
+    def test_max_inflight(self):
+        running = []
+        lock = threading.Lock()
+
+        def _run(num):
+            with lock:
+                running.append(num)
+            return num
+
+        results = workers.run_concurrent(_run, maps=range(100),
+                                         max_workers=2, max_inflight=3)
+        next(results)
+        self.assertLessEqual(len(running), 4)
+        results.close()
+
+    def test_cancel_on_error(self):
+        called = []
+
+        def _run(num):
+            if num == 1:
+                raise ValueError(num)
+            time.sleep(0.01)
+            called.append(num)
+            return num
+
+        with self.assertRaises(ValueError):
+            list(workers.run_concurrent(_run, maps=range(100),
+                                        max_workers=2))
+        self.assertLess(len(called), 10)
+
+    def test_rate(self):
+        start = time.monotonic()
+        list(workers.run_concurrent(lambda x: x, maps=range(6),
+                                    max_workers=6, rate=50))
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+class IterCompletedTestCases(unittest.TestCase):
+
+    def test_ordered(self):
+        executor = futures.ThreadPoolExecutor(max_workers=4)
+        completed = workers.iter_completed(
+            executor, lambda x: time.sleep(0.01 * (5 - x)) or x, range(5), 2)
+        self.assertEqual([future.result() for future in completed],
+                         list(range(5)))
+
+
+class TokenBucketTestCases(unittest.TestCase):
+
+    def test_rate_limiter(self):
+        limiter = workers.RateLimiter(50)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_consume(self):
+        bucket = workers.TokenBucket(1000, burst=100)
+        start = time.monotonic()
+        bucket.consume(100)
+        self.assertLess(time.monotonic() - start, 0.05)
+        for _ in range(3):
+            bucket.consume(100)
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_concurrent_consume(self):
+        bucket = workers.TokenBucket(1000, burst=100)
+        start = time.monotonic()
+        threads = [threading.Thread(target=bucket.consume, args=(100,))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
@@ -0,0 +1,67 @@
+import io
+import threading
+import unittest
+
+from easy2use.component import pbr
+
+MB = 1024 * 1024
+
+
+class TtyStream(io.StringIO):
+
+    def isatty(self):
+        return True
+
+
+class MultiProgressTestCases(unittest.TestCase):
+
+    def test_concurrent_update(self):
+        progress = pbr.MultiProgress(stream=io.StringIO())
+        task = progress.factory(4 * 10000)
+
+        def _update():
+            for _ in range(10000):
+                task.update(1)
+
+        threads = [threading.Thread(target=_update) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(task.completed, 40000)
+        self.assertEqual(progress.completed, 40000)
+
+    def test_render(self):
+        stream = io.StringIO()
+        progress = pbr.MultiProgress(stream=stream)
+        foo = progress.factory(2 * MB, description='foo.iso')
+        bar = progress.factory(2 * MB, description='bar.iso')
+        foo.update(MB)
+        bar.update(2 * MB)
+        bar.close()
+        progress.render()
+        self.assertEqual(stream.getvalue(),
+                         '1/2 files 3.0MB/4.0MB 75.0% 0B/s ETA --:--:--\n')
+
+    def test_render_top(self):
+        stream = TtyStream()
+        progress = pbr.MultiProgress(stream=stream, top=2)
+        for i in range(4):
+            progress.factory((i + 1) * MB, description=f'{i}.iso')
+        progress.render()
+        progress.render()
+        lines = stream.getvalue().split('\n')
+        self.assertEqual(len(lines), 3 * 2 + 1)
+        self.assertIn('3.iso', lines[1])
+        self.assertIn('2.iso', lines[2])
+        self.assertTrue(lines[3].startswith('\x1b[3F\x1b[J'))
+
+    def test_start_stop(self):
+        stream = io.StringIO()
+        with pbr.MultiProgress(interval=0.01, stream=stream) as progress:
+            task = progress.factory(MB)
+            task.update(MB)
+            task.close()
+        # the last line is rendered when the progress is stopped
+        self.assertTrue(stream.getvalue().splitlines()[-1].startswith(
+            '1/1 files 1.0MB/1.0MB 100.0%'))
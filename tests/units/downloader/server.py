@@ -0,0 +1,138 @@
+"""A local HTTP server for download tests
+
+Files are served from memory, single byte ranges, If-Range and
+If-None-Match are supported, the sending rate of each connection can be
+limited to simulate a remote host, and a connection can be dropped to
+simulate a broken link.
+"""
+import hashlib
+import re
+import threading
+import time
+from email import utils as email_utils
+from http import server
+
+RANGE_REGEX = re.compile(r'bytes=(\d+)-(\d*)$')
+SEND_SIZE = 16 * 1024
+LAST_MODIFIED = email_utils.formatdate(0, usegmt=True)
+
+
+class FileHandler(server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+    def _get_file(self):
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+        return data
+
+    def _etag(self, data):
+        return '"{}"'.format(hashlib.md5(data).hexdigest())
+
+    def _send_headers(self, status, length, content_range=None, data=b''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', self._etag(data))
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        if self.path.endswith(('/', '.html')):
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+        else:
+            self.send_header('Content-Type', 'application/octet-stream')
+        if self.server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.server.requests.append(('HEAD', self.path, dict(self.headers)))
+        if self.server.head_status:
+            self.send_response(self.server.head_status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = self._get_file()
+        if data is None:
+            return
+        if self._not_modified(data):
+            self._send_headers(304, 0, data=data)
+        else:
+            self._send_headers(200, len(data), data=data)
+
+    def _not_modified(self, data):
+        return self.headers.get('If-None-Match') == self._etag(data)
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path, dict(self.headers)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        data = self._get_file()
+        if data is None:
+            return
+        if self._not_modified(data):
+            self._send_headers(304, 0, data=data)
+            return
+        matched = self.server.accept_ranges and \
+            RANGE_REGEX.match(self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if matched and (not if_range or if_range == self._etag(data)):
+            start = int(matched.group(1))
+            end = int(matched.group(2) or len(data) - 1)
+            body = data[start:end + 1]
+            self._send_headers(206, len(body),
+                               f'bytes {start}-{end}/{len(data)}', data=data)
+        else:
+            body = data
+            self._send_headers(200, len(body), data=data)
+        self._send_body(body)
+
+    def _send_body(self, body):
+        rate = self.server.rate
+        fail_after, self.server.fail_after = self.server.fail_after, None
+        if fail_after is not None:
+            body = body[:fail_after]
+            self.close_connection = True
+        if not rate:
+            self.wfile.write(body)
+            return
+        for offset in range(0, len(body), SEND_SIZE):
+            chunk = body[offset:offset + SEND_SIZE]
+            self.wfile.write(chunk)
+            if rate:
+                time.sleep(len(chunk) / rate)
+
+
+class FileServer(server.ThreadingHTTPServer):
+    """
+    >>> with FileServer({'/foo.bin': b'foo'}) as file_server:
+    >>>     file_server.url('/foo.bin')
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, files, rate=None, accept_ranges=True, latency=None,
+                 head_status=None):
+        super().__init__(('127.0.0.1', 0), FileHandler)
+        self.files = files
+        self.rate = rate
+        self.accept_ranges = accept_ranges
+        self.latency = latency
+        self.head_status = head_status
+        self.fail_after = None
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_address[1]}{path}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+
+from easy2use.downloader.aio import driver
+from easy2use.downloader.urllib import driver as urllib_driver
+from tests.units.downloader import server
+
+KB = 1024
+
+
+class AsyncioDriverTestCases(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.files = {f'/file{i}.bin': os.urandom(4 * KB) for i in range(100)}
+
+    def _assert_downloaded(self, files):
+        for path, data in files.items():
+            with open(os.path.join(self.tmp_dir.name, path[1:]), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_download_urls(self):
+        files = dict(self.files, **{'/big.bin': os.urandom(3000 * KB)})
+        with server.FileServer(files) as file_server:
+            downloader = driver.AsyncioDriver(
+                download_dir=self.tmp_dir.name, workers=50, per_host_limit=4,
+                write_workers=2)
+            downloader.download_urls([file_server.url(p) for p in files])
+        self._assert_downloaded(files)
+        self.assertEqual(len(file_server.requests), len(files))
+
+    def test_download_not_found(self):
+        with server.FileServer({}) as file_server:
+            downloader = driver.AsyncioDriver(download_dir=self.tmp_dir.name)
+            downloader.download(file_server.url('/foo.bin'))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_stalled_body(self):
+        with server.FileServer({'/foo.bin': os.urandom(64 * KB)},
+                               rate=1) as file_server:
+            downloader = driver.AsyncioDriver(download_dir=self.tmp_dir.name,
+                                              timeout=0.5)
+            start = time.monotonic()
+            downloader.download(file_server.url('/foo.bin'))
+            self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_verify_checksums(self):
+        files = {'/foo.bin': b'foo', '/bar.bin': b'bar'}
+        with server.FileServer(files) as file_server:
+            downloader = driver.AsyncioDriver(download_dir=self.tmp_dir.name,
+                                              checksum_retries=2)
+            downloader.download_urls(
+                [file_server.url(path) for path in files],
+                checksums={'foo.bin': hashlib.sha256(b'foo').hexdigest(),
+                           'bar.bin': hashlib.sha256(b'baz').hexdigest()})
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['foo.bin'])
+        # the mismatched file is downloaded again checksum_retries times
+        self.assertEqual(
+            [path for _, path, _ in file_server.requests].count('/bar.bin'),
+            3)
+
+    def test_cache_not_supported(self):
+        self.assertRaises(ValueError, driver.AsyncioDriver, cache=True)
+
+    def test_benchmark_with_urllib3_driver(self):
+        costs = {}
+        urls = None
+        with server.FileServer(self.files, latency=0.02) as file_server:
+            urls = [file_server.url(p) for p in self.files]
+            # the same concurrency, so only the threads are compared with
+            # the event loop
+            for name, cls, kwargs in [
+                    ('urllib3', urllib_driver.Urllib3Driver, {}),
+                    ('asyncio', driver.AsyncioDriver,
+                     {'per_host_limit': 100})]:
+                downloader = cls(download_dir=self.tmp_dir.name,
+                                 workers=100, **kwargs)
+                start = time.monotonic()
+                downloader.download_urls(urls)
+                costs[name] = time.monotonic() - start
+                self._assert_downloaded(self.files)
+        self.assertLess(costs['asyncio'], costs['urllib3'])
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from easy2use.downloader.urllib import crawler
+from easy2use.downloader.urllib import driver
+from tests.units.downloader import server
+
+PAGES = {
+    '/': b'<html><body><a href="a/">a</a><a href="./b/index.html">b</a>'
+         b'<a href="foo.iso">foo</a><a href="http://other.host/x.iso">x</a>'
+         b'<a href="#top">top</a></body></html>',
+    '/a/': b'<a href="../foo.iso#1">foo</a><a href="bar.iso">bar</a>'
+           b'<a href="c/">c</a><a href="/">home</a>',
+    '/a/c/': b'<a href="deep.iso">deep</a>',
+    '/b/index.html': '<a href="café.txt">café</a>'.encode(),
+}
+
+
+class NormalizeUrlTestCases(unittest.TestCase):
+
+    def test_normalize_url(self):
+        self.assertEqual(
+            crawler.normalize_url('HTTP://Example.com:80/a/./b/../c?x=1#t'),
+            'http://example.com/a/c?x=1')
+        self.assertEqual(crawler.normalize_url('http://a.com'),
+                         'http://a.com/')
+        self.assertEqual(crawler.normalize_url('http://a.com:8080/b/../'),
+                         'http://a.com:8080/')
+
+
+class LinkParserTestCases(unittest.TestCase):
+
+    def test_feed_chunks(self):
+        parser = crawler.LinkParser()
+        page = '<a href="foo.iso">foo</a><A HREF="bar.iso">bar</A>'
+        for i in range(0, len(page), 7):
+            parser.feed(page[i:i + 7])
+        self.assertEqual(parser.links, ['foo.iso', 'bar.iso'])
+
+
+class CrawlerTestCases(unittest.TestCase):
+
+    def test_crawl(self):
+        with server.FileServer(PAGES) as file_server:
+            files = list(crawler.Crawler(max_depth=2).crawl(
+                file_server.url('/')))
+            host = file_server.url('')
+        self.assertEqual(sorted(files),
+                         [f'{host}/a/bar.iso', f'{host}/b/café.txt',
+                          f'{host}/foo.iso'])
+        # every page is fetched once
+        self.assertEqual(sorted(path for _, path, _ in file_server.requests),
+                         ['/', '/a/', '/b/index.html'])
+
+    def test_crawl_with_regex(self):
+        with server.FileServer(PAGES) as file_server:
+            files = list(crawler.Crawler(max_depth=3, file_regex=r'.*iso$')
+                         .crawl(file_server.url('/')))
+            host = file_server.url('')
+        self.assertEqual(sorted(files), [f'{host}/a/bar.iso',
+                                         f'{host}/a/c/deep.iso',
+                                         f'{host}/foo.iso'])
+
+    def test_crawl_and_download(self):
+        files = dict(PAGES, **{'/foo.iso': b'foo', '/a/bar.iso': b'bar'})
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                server.FileServer(files) as file_server:
+            downloader = driver.Urllib3Driver(download_dir=tmp_dir)
+            downloader.download_urls(
+                crawler.Crawler(max_depth=2, file_regex=r'.*iso$',
+                                http=downloader.http)
+                .crawl(file_server.url('/')))
+            self.assertEqual(sorted(os.listdir(tmp_dir)),
+                             ['bar.iso', 'foo.iso'])
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+
+from easy2use.downloader import driver
+
+
+class FakeDriver(driver.BaseDownloadDriver):
+
+    def download(self, url):
+        return url
+
+
+class DriverTestCases(unittest.TestCase):
+
+    def test_interleave_hosts(self):
+        urls = ['http://a/1', 'http://a/2', 'http://a/3', 'http://b/1',
+                'https://c/1', 'https://c/2']
+        self.assertEqual(driver.interleave_hosts(urls),
+                         ['http://a/1', 'http://b/1', 'https://c/1',
+                          'http://a/2', 'https://c/2', 'http://a/3'])
+
+    def test_host_slots(self):
+        slots = driver.HostSlots(2)
+        self.assertEqual(slots.acquire('a', 3), 2)
+        self.assertEqual(slots.acquire('a'), 0)
+        self.assertEqual(slots.acquire('b'), 1)
+        slots.release('a')
+        self.assertEqual(slots.acquire('a', 2), 1)
+        self.assertEqual(driver.HostSlots().acquire('a', 3), 3)
+
+    def test_run_scheduled(self):
+        started = []
+        lock = threading.Lock()
+
+        def _fetch(url):
+            with lock:
+                started.append(url)
+            time.sleep(0.1)
+            return url
+
+        downloader = FakeDriver(workers=3, host_connections=1)
+        results = list(downloader.run_scheduled(
+            _fetch, iter(['http://a/1', 'http://a/2', 'http://b/1',
+                          'http://a/3'])))
+        self.assertCountEqual(results, ['http://a/1', 'http://a/2',
+                                        'http://b/1', 'http://a/3'])
+        # the busy host a is skipped, and the urls of a are in order
+        self.assertEqual(started[:2], ['http://a/1', 'http://b/1'])
+        self.assertEqual([url for url in started if '//a/' in url],
+                         ['http://a/1', 'http://a/2', 'http://a/3'])
+
+    def test_parse_checksum(self):
+        self.assertEqual(driver.parse_checksum('SHA1:AB' + '0' * 38),
+                         ('sha1', 'ab' + '0' * 38))
+        self.assertEqual(driver.parse_checksum('0' * 64),
+                         ('sha256', '0' * 64))
+        self.assertRaises(ValueError, driver.parse_checksum, 'abc')
+
+    def test_parse_manifest(self):
+        manifest = '\n'.join([
+            '# comment', 'a' * 64 + '  foo.iso', 'b' * 64 + ' *bar iso',
+            'SHA512 (baz.iso) = ' + 'c' * 128, ''])
+        self.assertEqual(driver.parse_manifest(manifest),
+                         {'foo.iso': 'a' * 64, 'bar iso': 'b' * 64,
+                          'baz.iso': 'sha512:' + 'c' * 128})
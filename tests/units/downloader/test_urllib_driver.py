@@ -0,0 +1,298 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from easy2use.downloader import driver as base_driver
+from easy2use.downloader.urllib import driver
+from tests.units.downloader import server
+
+KB = 1024
+
+
+class Urllib3DriverTestCases(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.data = os.urandom(512 * KB)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def _get_driver(self, **kwargs):
+        return driver.Urllib3Driver(download_dir=self.tmp_dir.name,
+                                    **kwargs)
+
+    def _read(self, name):
+        with open(os.path.join(self.tmp_dir.name, name), 'rb') as f:
+            return f.read()
+
+    def test_download(self):
+        with server.FileServer({'/foo.bin': self.data}) as file_server:
+            self._get_driver().download_urls([file_server.url('/foo.bin')])
+        self.assertEqual(self._read('foo.bin'), self.data)
+
+    def test_download_segmented(self):
+        with server.FileServer({'/foo.bin': self.data}) as file_server:
+            self._get_driver(segments=4, segment_min_size=64 * KB) \
+                .download_urls([file_server.url('/foo.bin')])
+        self.assertEqual(self._read('foo.bin'), self.data)
+        ranges = [headers.get('Range')
+                  for method, _, headers in file_server.requests
+                  if method == 'GET']
+        self.assertEqual(len(ranges), 4)
+        self.assertIn('bytes=0-131071', ranges)
+
+    def test_download_segmented_fallback(self):
+        with server.FileServer({'/foo.bin': self.data},
+                               accept_ranges=False) as file_server:
+            self._get_driver(segments=4, segment_min_size=64 * KB) \
+                .download_urls([file_server.url('/foo.bin')])
+        self.assertEqual(self._read('foo.bin'), self.data)
+        self.assertEqual([method for method, _, _ in file_server.requests],
+                         ['HEAD', 'GET'])
+
+    def test_download_segmented_speedup(self):
+        costs = []
+        with server.FileServer({'/foo.bin': self.data},
+                               rate=2048 * KB) as file_server:
+            for segments in (1, 4):
+                start = time.monotonic()
+                self._get_driver(segments=segments,
+                                 segment_min_size=64 * KB) \
+                    .download_urls([file_server.url('/foo.bin')])
+                costs.append(time.monotonic() - start)
+                self.assertEqual(self._read('foo.bin'), self.data)
+        self.assertLess(costs[1], costs[0] * 0.6)
+
+    def _exists(self, name):
+        return os.path.exists(os.path.join(self.tmp_dir.name, name))
+
+    def test_download_with_multi_progress(self):
+        files = {f'/{i}.bin': self.data for i in range(3)}
+        with server.FileServer(files) as file_server, \
+                mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            self._get_driver(progress=True).download_urls(
+                [file_server.url(path) for path in files])
+        self.assertEqual(self._read('2.bin'), self.data)
+        self.assertTrue(stderr.getvalue().splitlines()[-1].startswith(
+            '3/3 files 1.5MB/1.5MB 100.0%'))
+
+    def test_plan(self):
+        files = {f'/{size}.bin': os.urandom(size * KB)
+                 for size in (1, 64, 8, 512, 4)}
+        with server.FileServer(files) as file_server:
+            self._get_driver(plan=True, workers=1).download_urls(
+                [file_server.url(path) for path in files])
+        self.assertEqual(self._read('512.bin'), files['/512.bin'])
+        self.assertEqual(
+            [(method, path) for method, path, _ in file_server.requests
+             if method == 'GET'],
+            [('GET', f'/{size}.bin') for size in (512, 64, 8, 4, 1)])
+        self.assertEqual(
+            [method for method, _, _ in file_server.requests].count('HEAD'),
+            len(files))
+
+    def test_plan_segmented(self):
+        files = {'/small.bin': b'small', '/foo.bin': self.data,
+                 '/missing.bin': None}
+        with server.FileServer(files) as file_server:
+            urls = [file_server.url(path) for path in files]
+            downloader = self._get_driver(plan=True, segments=4,
+                                          segment_min_size=64 * KB,
+                                          cache=True)
+            downloader.download_urls(urls)
+            self.assertEqual(self._read('foo.bin'), self.data)
+            self.assertEqual(self._read('small.bin'), b'small')
+            self.assertFalse(self._exists('missing.bin'))
+            # the sizes are known, HEAD is not sent again, except for the
+            # failed url
+            self.assertEqual(
+                [method for method, _, _ in file_server.requests].count(
+                    'HEAD'), 4)
+            file_server.requests.clear()
+            downloader.download_urls(urls)
+        # not modified files are skipped in the planning phase
+        self.assertEqual(
+            sorted((method, path) for method, path, _
+                   in file_server.requests),
+            [('GET', '/missing.bin'), ('HEAD', '/foo.bin'),
+             ('HEAD', '/missing.bin'), ('HEAD', '/missing.bin'),
+             ('HEAD', '/small.bin')])
+
+    def test_download_not_found(self):
+        with server.FileServer({'/foo.bin': None}) as file_server:
+            self._get_driver().download_urls([file_server.url('/foo.bin')])
+            self._get_driver(segments=4).download_urls(
+                [file_server.url('/foo.bin')])
+        # the error page is not saved as the file
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+        self.assertEqual([method for method, _, _ in file_server.requests],
+                         ['GET', 'HEAD', 'GET'])
+
+    def test_download_head_rejected(self):
+        with server.FileServer({'/foo.bin': self.data},
+                               head_status=405) as file_server:
+            self._get_driver(segments=4, segment_min_size=64 * KB) \
+                .download_urls([file_server.url('/foo.bin')])
+        self.assertEqual(self._read('foo.bin'), self.data)
+        self.assertEqual([method for method, _, _ in file_server.requests],
+                         ['HEAD', 'GET'])
+
+    def test_download_truncated(self):
+        with server.FileServer({'/foo.bin': self.data},
+                               accept_ranges=False) as file_server:
+            file_server.fail_after = 100 * KB
+            self._get_driver().download_urls([file_server.url('/foo.bin')])
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_benchmark_buffer_size(self):
+        data = os.urandom(32 * 1024 * KB)
+        costs = {}
+        with server.FileServer({'/big.bin': data}) as file_server:
+            for name, kwargs in [
+                    ('fixed', {'buffer_size': 8 * KB,
+                               'max_buffer_size': 8 * KB}),
+                    ('adaptive', {})] * 3:
+                start = time.monotonic()
+                self._get_driver(**kwargs).download_urls(
+                    [file_server.url('/big.bin')])
+                cost = time.monotonic() - start
+                costs[name] = min(costs.get(name, cost), cost)
+        self.assertEqual(self._read('big.bin'), data)
+        self.assertLess(costs['adaptive'], costs['fixed'])
+
+    def test_rate_limit(self):
+        with server.FileServer({'/foo.bin': self.data}) as file_server:
+            start = time.monotonic()
+            self._get_driver(rate_limit=256 * KB).download_urls(
+                [file_server.url('/foo.bin')])
+            cost = time.monotonic() - start
+        # the first 256KB is the burst
+        self.assertGreaterEqual(cost, 0.9)
+        self.assertEqual(self._read('foo.bin'), self.data)
+
+    def test_host_connections(self):
+        files = {f'/{i}.bin': self.data for i in range(4)}
+        with server.FileServer(files, latency=0.1) as file_server:
+            start = time.monotonic()
+            self._get_driver(workers=4, host_connections=1).download_urls(
+                [file_server.url(path) for path in files])
+            cost = time.monotonic() - start
+        self.assertGreaterEqual(cost, 0.4)
+        self.assertEqual(self._read('3.bin'), self.data)
+
+    def test_download_not_modified(self):
+        with server.FileServer({'/foo.bin': self.data}) as file_server:
+            url = file_server.url('/foo.bin')
+            self._get_driver(cache=True).download_urls([url])
+            self._get_driver(cache=True).download_urls([url])
+            self._get_driver(cache=True, segments=4,
+                             segment_min_size=64 * KB).download_urls([url])
+        self.assertEqual(self._read('foo.bin'), self.data)
+        self.assertEqual(
+            [(method, headers.get('If-None-Match'))
+             for method, _, headers in file_server.requests],
+            [('GET', None), ('GET', '"{}"'.format(hashlib.md5(self.data)
+                                                  .hexdigest())),
+             ('HEAD', '"{}"'.format(hashlib.md5(self.data).hexdigest()))])
+        cached = base_driver.DownloadCache(
+            os.path.join(self.tmp_dir.name, '.download-cache.json')).get(url)
+        self.assertEqual(cached['sha256'],
+                         hashlib.sha256(self.data).hexdigest())
+
+    def test_download_force(self):
+        with server.FileServer({'/foo.bin': self.data}) as file_server:
+            url = file_server.url('/foo.bin')
+            self._get_driver(cache=True).download_urls([url])
+            self._get_driver(cache=True, force=True).download_urls([url])
+            os.remove(os.path.join(self.tmp_dir.name, 'foo.bin'))
+            self._get_driver(cache=True).download_urls([url])
+        self.assertEqual(self._read('foo.bin'), self.data)
+        self.assertEqual([headers.get('If-None-Match')
+                          for _, _, headers in file_server.requests],
+                         [None, None, None])
+
+    def test_verify_checksum(self):
+        sha256 = hashlib.sha256(self.data).hexdigest()
+        with server.FileServer({'/foo.bin': self.data}) as file_server:
+            for kwargs in [{}, {'segments': 4, 'segment_min_size': 64 * KB}]:
+                self._get_driver(**kwargs).download_urls(
+                    [file_server.url('/foo.bin')],
+                    checksums={'foo.bin': f'sha256:{sha256}'})
+                self.assertEqual(self._read('foo.bin'), self.data)
+        self.assertEqual(len(file_server.requests), 1 + 5)
+
+    def test_verify_manifest(self):
+        manifest = os.path.join(self.tmp_dir.name, 'MD5SUMS')
+        with open(manifest, 'w') as f:
+            f.write(f'{hashlib.md5(self.data).hexdigest()} *foo.bin\n'
+                    f'{hashlib.md5(b"bar").hexdigest()}  bar.bin\n')
+        with server.FileServer({'/foo.bin': self.data,
+                                '/bar.bin': b'baz'}) as file_server:
+            self._get_driver(checksum_retries=2).download_urls(
+                [file_server.url('/foo.bin'), file_server.url('/bar.bin')],
+                manifest=manifest)
+        self.assertEqual(self._read('foo.bin'), self.data)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmp_dir.name, 'bar.bin')))
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)),
+                         ['MD5SUMS', 'foo.bin'])
+        self.assertEqual(
+            [path for _, path, _ in file_server.requests].count('/bar.bin'),
+            3)
+
+    def test_verify_resumed_segments(self):
+        sha256 = hashlib.sha256(self.data).hexdigest()
+        part_path = os.path.join(self.tmp_dir.name, 'foo.bin.part')
+        with server.FileServer({'/foo.bin': self.data}) as file_server:
+            url = file_server.url('/foo.bin')
+            file_server.fail_after = 100 * KB
+            downloader = self._get_driver(segments=4,
+                                          segment_min_size=64 * KB)
+            downloader.download_urls([url])
+            self.assertTrue(os.path.exists(part_path))
+            downloader.download_urls([url], checksums={url: sha256})
+        self.assertEqual(self._read('foo.bin'), self.data)
+
+    def test_resume_stream(self):
+        download_driver = self._get_driver(buffer_size=4 * KB)
+        with server.FileServer({'/foo.bin': self.data}) as file_server:
+            file_server.fail_after = 100 * KB
+            download_driver.download_urls([file_server.url('/foo.bin')])
+            self.assertFalse(self._exists('foo.bin'))
+            self.assertTrue(self._exists('foo.bin.part'))
+            self.assertTrue(self._exists('foo.bin.part.json'))
+
+            download_driver.download_urls([file_server.url('/foo.bin')])
+        self.assertEqual(self._read('foo.bin'), self.data)
+        self.assertFalse(self._exists('foo.bin.part'))
+        self.assertFalse(self._exists('foo.bin.part.json'))
+        _, _, headers = file_server.requests[-1]
+        self.assertEqual(headers['Range'], f'bytes={100 * KB}-')
+        self.assertIn('If-Range', headers)
+
+    def test_resume_changed_file(self):
+        download_driver = self._get_driver(buffer_size=4 * KB)
+        files = {'/foo.bin': self.data}
+        with server.FileServer(files) as file_server:
+            file_server.fail_after = 100 * KB
+            download_driver.download_urls([file_server.url('/foo.bin')])
+            files['/foo.bin'] = os.urandom(256 * KB)
+            download_driver.download_urls([file_server.url('/foo.bin')])
+        self.assertEqual(self._read('foo.bin'), files['/foo.bin'])
+
+    def test_resume_segmented(self):
+        download_driver = self._get_driver(segments=4,
+                                           segment_min_size=64 * KB,
+                                           buffer_size=4 * KB)
+        with server.FileServer({'/foo.bin': self.data}) as file_server:
+            file_server.fail_after = 32 * KB
+            download_driver.download_urls([file_server.url('/foo.bin')])
+            self.assertTrue(self._exists('foo.bin.part.json'))
+            download_driver.download_urls([file_server.url('/foo.bin')])
+        self.assertEqual(self._read('foo.bin'), self.data)
+        resumed = [headers['Range'] for method, _, headers
+                   in file_server.requests if method == 'GET'][4:]
+        self.assertEqual(len(resumed), 1)
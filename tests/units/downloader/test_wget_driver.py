@@ -0,0 +1,34 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from easy2use.downloader.wget import driver
+from tests.units.downloader import server
+
+KB = 1024
+
+
+@unittest.skipUnless(os.path.exists(driver.WgetDriver.WGET),
+                     'wget is not installed')
+class WgetDriverTestCases(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.data = os.urandom(64 * KB)
+
+    def test_verify_checksums(self):
+        files = {'/foo.bin': self.data, '/bar.bin': self.data}
+        with server.FileServer(files) as file_server:
+            downloader = driver.WgetDriver(download_dir=self.tmp_dir.name,
+                                           checksum_retries=2)
+            downloader.download_urls(
+                [file_server.url(path) for path in files],
+                checksums={'foo.bin': hashlib.sha256(self.data).hexdigest(),
+                           'bar.bin': 'sha256:' + '0' * 64})
+        # the mismatched file is downloaded again and removed
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['foo.bin'])
+        self.assertEqual(
+            [path for _, path, _ in file_server.requests].count('/bar.bin'),
+            3)
@@ -0,0 +1,126 @@
+import asyncio
+import multiprocessing
+import time
+import unittest
+
+from easy2use import cache
+
+
+def _set_in_child(shared_cache, key, value):
+    shared_cache.set(key, value)
+
+
+class SharedMemoryCacheTestCases(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache = cache.SharedMemoryCache(capacity=8, slot_size=256)
+
+    def test_set_and_get(self):
+        self.cache.set('foo', {'bar': 1})
+        self.assertEqual(self.cache.get('foo'), {'data': {'bar': 1}})
+        self.assertIsNone(self.cache.get('bar'))
+
+    def test_update_and_delete(self):
+        self.cache.set('foo', 1)
+        self.cache.set('foo', 2)
+        self.assertEqual(self.cache.get('foo'), {'data': 2})
+        self.assertEqual(len(self.cache), 1)
+        self.cache.delete('foo')
+        self.assertIsNone(self.cache.get('foo'))
+
+    def test_collisions(self):
+        for i in range(8):
+            self.cache.set(i, i * 10)
+        for i in range(8):
+            self.assertEqual(self.cache.get(i), {'data': i * 10})
+        self.cache.set('overflow', 1)
+        self.assertIsNone(self.cache.get('overflow'))
+
+    def test_expired(self):
+        shared_cache = cache.SharedMemoryCache(capacity=8, expired=0.01)
+        shared_cache.set('foo', 1)
+        time.sleep(0.02)
+        self.assertIsNone(shared_cache.get('foo'))
+
+    def test_tombstones_rebuilt(self):
+        shared_cache = cache.SharedMemoryCache(capacity=4096, slot_size=64)
+        shared_cache.set('kept', 1)
+        for i in range(4096):
+            shared_cache.set(i, i)
+            shared_cache.delete(i)
+        self.assertLessEqual(shared_cache._tombstones.value,
+                             shared_cache.max_tombstones)
+        self.assertEqual(shared_cache.get('kept'), {'data': 1})
+        self.assertEqual(len(shared_cache), 1)
+        start = time.monotonic()
+        for i in range(100):
+            self.assertIsNone(shared_cache.get(f'missing{i}'))
+        # a miss probes at most max_probe slots
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_item_too_large(self):
+        self.assertRaises(ValueError, self.cache.set, 'foo', 'x' * 256)
+
+    def test_shared_with_forked_process(self):
+        ctx = multiprocessing.get_context('fork')
+        process = ctx.Process(target=_set_in_child,
+                              args=(self.cache, 'foo', 'from child'))
+        process.start()
+        process.join()
+        self.assertEqual(self.cache.get('foo'), {'data': 'from child'})
+
+
+class AsyncLocalCacheTestCases(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache = cache.AsyncLocalCache()
+        self.calls = 0
+
+    def test_memoize_share_pending_task(self):
+
+        @self.cache.memoize
+        async def get_value(value):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return value * 2
+
+        async def main():
+            results = await asyncio.gather(*[get_value(1) for _ in range(5)])
+            results.append(await get_value(1))
+            return results
+
+        self.assertEqual(asyncio.run(main()), [2] * 6)
+        self.assertEqual(self.calls, 1)
+
+    def test_cancel_awaiter_not_cancel_task(self):
+
+        @self.cache.memoize
+        async def get_value():
+            self.calls += 1
+            await asyncio.sleep(0.02)
+            return 'foo'
+
+        async def main():
+            first = asyncio.ensure_future(get_value())
+            second = asyncio.ensure_future(get_value())
+            await asyncio.sleep(0.005)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(main()), 'foo')
+        self.assertEqual(self.calls, 1)
+
+    def test_exception_not_cached(self):
+
+        @self.cache.memoize
+        async def get_value():
+            self.calls += 1
+            raise RuntimeError('failed')
+
+        async def main():
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    await get_value()
+
+        asyncio.run(main())
+        self.assertEqual(self.calls, 2)
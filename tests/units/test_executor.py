@@ -0,0 +1,289 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+import unittest
+
+from easy2use.common import exceptions
+from easy2use import executor
+
+
+class LinuxExecutorTestCases(unittest.TestCase):
+
+    def test_execute(self):
+        result = executor.LinuxExecutor.execute(
+            ['echo', 'foo;', 'echo', 'bar', '1>&2;', 'exit', '3'])
+        self.assertEqual(result, (3, 'foo\n', 'bar\n'))
+
+    def test_execute_large_stderr(self):
+        result = executor.LinuxExecutor.execute(
+            ['head -c 1000000 /dev/zero | tr "\\0" "x" 1>&2; echo done'],
+            timeout=10)
+        self.assertEqual(result.status, 0)
+        self.assertEqual(result.stdout, 'done\n')
+        self.assertEqual(len(result.stderr), 1000000)
+
+    def test_execute_callbacks(self):
+        lines = []
+        executor.LinuxExecutor.execute(['printf "a\\nb"'],
+                                       on_stdout=lines.append)
+        self.assertEqual(lines, ['a\n', 'b'])
+
+    def test_execute_stream(self):
+        stream = executor.LinuxExecutor.execute_stream(
+            'echo foo; echo bar 1>&2')
+        self.assertEqual(sorted(stream), [('stderr', 'bar\n'),
+                                          ('stdout', 'foo\n')])
+        self.assertEqual(stream.returncode, 0)
+
+    def test_execute_timeout(self):
+        start = time.monotonic()
+        self.assertRaises(exceptions.ExecuteTimeout,
+                          executor.LinuxExecutor.execute,
+                          ['sleep 10 & sleep 10'], timeout=0.2)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_execute_spooled(self):
+        result = executor.LinuxExecutor.execute_spooled(
+            'seq 1 10000', max_memory=1024)
+        self.assertTrue(result.stdout._rolled)
+        self.assertEqual(len(result.stdout.readlines()), 10000)
+        result.stdout.close()
+        result.stderr.close()
+
+    def test_stream_long_line(self):
+        size = executor.MAX_LINE_SIZE * 3
+        events = list(executor.LinuxExecutor.execute_stream(
+            f"head -c {size} /dev/zero | tr '\\0' a; echo; echo b"))
+        self.assertGreater(len(events), 3)
+        self.assertLessEqual(
+            max(len(line) for _, line in events),
+            executor.MAX_LINE_SIZE + executor.READ_SIZE)
+        self.assertEqual(''.join(line for _, line in events),
+                         'a' * size + '\nb\n')
+
+
+class AsyncBatchExecutorTestCases(unittest.TestCase):
+
+    def test_run_ordered(self):
+        batch = executor.AsyncBatchExecutor(concurrency=4)
+        results = batch.run([['sh', '-c', 'sleep 0.1; echo 0'],
+                             'echo 1', ['echo', '2']])
+        self.assertEqual([result.stdout for result in results],
+                         ['0\n', '1\n', '2\n'])
+
+    def test_run_unordered(self):
+        batch = executor.AsyncBatchExecutor(concurrency=4)
+        results = batch.run(['sleep 0.2; echo 0', 'echo 1'], ordered=False)
+        self.assertEqual([result.stdout for result in results],
+                         ['1\n', '0\n'])
+
+    def test_concurrency(self):
+        batch = executor.AsyncBatchExecutor(concurrency=2)
+        start = time.monotonic()
+        batch.run(['sleep 0.2'] * 4)
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+
+    def test_timeout(self):
+        batch = executor.AsyncBatchExecutor(timeout=0.2)
+        results = batch.run(['sleep 5', 'echo 1'], return_exceptions=True)
+        self.assertIsInstance(results[0], exceptions.ExecuteTimeout)
+        self.assertEqual(results[1].stdout, '1\n')
+        self.assertRaises(exceptions.ExecuteTimeout, batch.run, ['sleep 5'])
+
+
+def _pow2(num):
+    if num < 0:
+        raise ValueError('negative number')
+    return num * num
+
+
+def _hello():
+    return 'hello'
+
+
+class RunProcessesTestCases(unittest.TestCase):
+
+    def test_run_processes_ordered(self):
+        results = executor.run_processes(_pow2, maps=iter(range(100)),
+                                         max_workers=2, chunksize=7,
+                                         ordered=True)
+        self.assertEqual(list(results), [i * i for i in range(100)])
+
+    def test_run_processes_unordered(self):
+        results = executor.run_processes(_pow2, maps=range(50),
+                                         max_workers=3, chunksize=4,
+                                         max_inflight=2)
+        self.assertEqual(sorted(results), [i * i for i in range(50)])
+
+    def test_run_processes_nums(self):
+        results = executor.run_processes(_hello, nums=3, max_workers=2)
+        self.assertEqual(list(results), ['hello'] * 3)
+
+    def test_run_processes_with_usage(self):
+        results = list(executor.run_processes(_pow2, maps=range(4),
+                                              max_workers=2, ordered=True,
+                                              with_usage=True))
+        self.assertEqual([result for result, _ in results], [0, 1, 4, 9])
+        for _, usage in results:
+            self.assertIsInstance(usage, executor.ResourceUsage)
+            self.assertGreater(usage.max_rss, 0)
+
+    def test_run_processes_failed(self):
+        with self.assertRaises(executor.TaskFailed) as context:
+            list(executor.run_processes(_pow2, maps=[1, 2, -3, 4],
+                                        max_workers=2, ordered=True))
+        self.assertEqual(context.exception.item, -3)
+        self.assertIsInstance(context.exception.error, ValueError)
+
+
+def _getpid(_=None):
+    return os.getpid()
+
+
+def _return_lambda():
+    return lambda: 1
+
+
+def _exit():
+    os._exit(1)
+
+
+class WorkerPoolTestCases(unittest.TestCase):
+
+    def test_submit_and_map(self):
+        with executor.WorkerPool(workers=2, preload=['json']) as pool:
+            self.assertEqual(pool.submit(pow, 2, 10).result(), 1024)
+            self.assertEqual(list(pool.map(_pow2, range(5))),
+                             [0, 1, 4, 9, 16])
+            self.assertRaises(ValueError,
+                              pool.submit(_pow2, -1).result)
+
+    def test_task_usage(self):
+        report = executor.UsageReport()
+        with executor.WorkerPool(workers=1) as pool:
+            for size in (10, 10 ** 5):
+                future = pool.submit(bytes, size)
+                future.result()
+                report.add(f'bytes {size}', future)
+        usage = future.usage
+        self.assertGreater(usage.wall_time, 0)
+        self.assertGreater(usage.max_rss, 0)
+        self.assertEqual(report.rank('output_bytes')[0][0], 'bytes 100000')
+
+    def test_recycle_workers(self):
+        with executor.WorkerPool(workers=1, max_tasks=2) as pool:
+            pids = [pool.submit(_getpid).result() for _ in range(4)]
+        stats = pool.stats()
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertEqual(stats[0]['total_tasks'], 4)
+        self.assertEqual(stats[0]['restarts'], 2)
+
+    def test_worker_lost(self):
+        with executor.WorkerPool(workers=1) as pool:
+            self.assertRaises(executor.WorkerLost,
+                              pool.submit(_exit).result)
+            self.assertEqual(pool.submit(pow, 2, 2).result(), 4)
+
+    def test_task_not_picklable(self):
+        with executor.WorkerPool(workers=1) as pool:
+            pid = pool.submit(_getpid).result(timeout=5)
+            self.assertRaises(Exception,
+                              pool.submit(lambda: 1).result, timeout=5)
+            self.assertRaises(TypeError,
+                              pool.submit(_return_lambda).result, timeout=5)
+            self.assertEqual(pool.submit(_getpid).result(timeout=5), pid)
+        self.assertEqual(pool.stats()[0]['restarts'], 0)
+
+    def test_handle_sigterm(self):
+        code = ('import os, signal, time\n'
+                'from easy2use import executor\n'
+                'pool = executor.WorkerPool(workers=1)\n'
+                'pool.start()\n'
+                'pool.handle_signals()\n'
+                'os.kill(os.getpid(), signal.SIGTERM)\n'
+                'time.sleep(10)\n')
+        proc = subprocess.run([sys.executable, '-c', code], timeout=20,
+                              cwd=os.path.dirname(os.path.dirname(
+                                  os.path.dirname(__file__))))
+        self.assertEqual(proc.returncode, -signal.SIGTERM)
+
+
+class ShellSessionTestCases(unittest.TestCase):
+
+    def test_execute(self):
+        with executor.LinuxExecutor.session() as session:
+            self.assertEqual(session.execute('echo foo; echo bar 1>&2'),
+                             (0, 'foo\n', 'bar\n'))
+            self.assertEqual(session.execute(['printf', 'foo']),
+                             (0, 'foo', ''))
+            self.assertEqual(session.execute('false').status, 1)
+            session.execute('cd /tmp')
+            self.assertEqual(session.execute('pwd').stdout, '/tmp\n')
+
+    def test_large_output(self):
+        with executor.LinuxExecutor.session() as session:
+            for size in (executor.READ_SIZE - 40, 8 * 1024 * 1024):
+                result = session.execute(
+                    f"head -c {size} /dev/zero | tr '\\0' a; false")
+                self.assertEqual(result.status, 1)
+                self.assertEqual(result.stdout, 'a' * size)
+
+    def test_shell_exited(self):
+        with executor.ShellSession() as session:
+            self.assertRaises(exceptions.ShellSessionExited,
+                              session.execute, 'exit 3')
+            self.assertEqual(session.execute('echo foo').stdout, 'foo\n')
+
+    def test_malformed_command(self):
+        for shell in ('/bin/sh', '/bin/bash'):
+            with executor.ShellSession(shell=shell) as session:
+                for cmd in ('echo "foo', 'if true', "echo 'foo"):
+                    result = session.execute(cmd, timeout=5)
+                    self.assertNotEqual(result.status, 0)
+                    self.assertEqual(result.stdout, '')
+                self.assertEqual(session.execute('echo "foo"').stdout,
+                                 'foo\n')
+
+    def test_timeout(self):
+        with executor.ShellSession() as session:
+            self.assertRaises(exceptions.ExecuteTimeout,
+                              session.execute, 'sleep 5', timeout=0.2)
+            self.assertEqual(session.execute('echo foo').stdout, 'foo\n')
+
+    def test_session_pool(self):
+        with executor.ShellSessionPool(size=2) as pool:
+            results = [pool.execute(f'echo {i}') for i in range(4)]
+        self.assertEqual([r.stdout for r in results],
+                         ['0\n', '1\n', '2\n', '3\n'])
+
+
+class UsageTestCases(unittest.TestCase):
+
+    def test_execute_usage(self):
+        result = executor.LinuxExecutor.execute(
+            ['i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done; echo done'])
+        self.assertEqual(result, (0, 'done\n', ''))
+        self.assertGreater(result.usage.user_time + result.usage.sys_time, 0)
+        self.assertGreater(result.usage.max_rss, 0)
+        self.assertGreaterEqual(result.usage.wall_time,
+                                result.usage.user_time)
+        self.assertEqual(result.usage.output_bytes, 5)
+
+    def test_usage_report(self):
+        report = executor.UsageReport()
+        for cmd in ['echo foo', 'seq 1 100000 > /dev/null', 'true']:
+            report.add(cmd, executor.LinuxExecutor.execute([cmd]))
+        self.assertEqual(report.rank(top=1)[0][0], 'seq 1 100000 > /dev/null')
+        self.assertEqual(report.rank(key='output_bytes')[0][0], 'echo foo')
+        self.assertEqual(report.total()['output_bytes'], 4)
+        self.assertIn('echo foo', report.dumps())
+        self.assertRaises(ValueError, report.rank, key='foo')
+
+    def test_worker_pool_stats(self):
+        with executor.WorkerPool(workers=1) as pool:
+            pool.submit(sum, range(1000000)).result()
+        self.assertGreater(pool.stats()[0]['user_time'], 0)
@@ -0,0 +1,21 @@
+import socket
+import unittest
+
+from easy2use import net
+
+
+class PortScanTestCases(unittest.TestCase):
+
+    def test_port_scan(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        port = server.getsockname()[1]
+        done = []
+        results = net.port_scan('127.0.0.1', port_start=port,
+                                port_end=port, threads=2,
+                                callback=lambda future: done.append(
+                                    future.result()))
+        self.assertEqual(results, [net.ScanResult('127.0.0.1', port, True)])
+        self.assertEqual(done, results)
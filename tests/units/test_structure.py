@@ -0,0 +1,154 @@
+import bisect
+import random
+import statistics
+import unittest
+
+from easy2use import structure
+
+
+class RingBufferTestCases(unittest.TestCase):
+
+    def test_append(self):
+        buffer = structure.RingBuffer(3)
+        buffer.extend([1, 2])
+        self.assertEqual(list(buffer), [1, 2])
+        self.assertFalse(buffer.is_full())
+        buffer.extend([3, 4, 5])
+        self.assertEqual(list(buffer), [3, 4, 5])
+        self.assertEqual((buffer[0], buffer[-1]), (3, 5))
+        self.assertRaises(IndexError, buffer.__getitem__, 3)
+
+    def test_typecode(self):
+        buffer = structure.RingBuffer(4, typecode='d')
+        buffer.extend(range(6))
+        self.assertEqual(list(buffer), [2.0, 3.0, 4.0, 5.0])
+        segments = buffer.segments()
+        self.assertEqual(len(segments), 2)
+        self.assertEqual([v for s in segments for v in s.tolist()],
+                         [2.0, 3.0, 4.0, 5.0])
+
+    def test_clear(self):
+        buffer = structure.RingBuffer(2)
+        buffer.extend([1, 2, 3])
+        buffer.clear()
+        self.assertEqual(list(buffer), [])
+        self.assertEqual(buffer.segments(), [[]])
+
+
+class LastNListTestCases(unittest.TestCase):
+
+    def test_last_n_list(self):
+        last = structure.LastNList(2)
+        for i in range(1, 5):
+            last.append(i)
+        self.assertEqual(last.all(), [3, 4])
+        self.assertEqual(last.get(0), 3)
+        self.assertEqual(str(last), '[3, 4]')
+        last.clean()
+        self.assertEqual(last.all(), [])
+
+
+class SortedBlocksTestCases(unittest.TestCase):
+
+    def test_add_remove(self):
+        values = structure.SortedBlocks(load=4)
+        expected = []
+        rand = random.Random(1)
+        for _ in range(2000):
+            if expected and rand.random() < 0.45:
+                value = rand.choice(expected)
+                values.remove(value)
+                expected.remove(value)
+            else:
+                value = rand.randint(0, 50)
+                values.add(value)
+                bisect.insort(expected, value)
+            self.assertEqual(len(values), len(expected))
+        self.assertEqual(list(values), expected)
+        self.assertEqual([values[i] for i in range(-len(expected), 0)],
+                         expected)
+        self.assertRaises(ValueError, values.remove, 51)
+        self.assertRaises(IndexError, values.__getitem__, len(expected))
+
+
+class RollingStatsTestCases(unittest.TestCase):
+
+    def test_count_window(self):
+        stats = structure.RollingStats(size=4)
+        for value in [5, 1, 9, 3, 7, 2]:
+            stats.add(value)
+        window = [9, 3, 7, 2]
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.sum, sum(window))
+        self.assertAlmostEqual(stats.mean, statistics.mean(window))
+        self.assertAlmostEqual(stats.variance, statistics.pvariance(window))
+        self.assertEqual((stats.min, stats.max), (2, 9))
+        self.assertEqual(stats.percentile(50), 5)
+        self.assertEqual(stats.percentile(100), 9)
+
+    def test_time_window(self):
+        now = [0]
+        stats = structure.RollingStats(window=10, clock=lambda: now[0])
+        for value in range(20):
+            now[0] = value
+            stats.add(value)
+        self.assertEqual(stats.count, 10)
+        self.assertEqual((stats.min, stats.max), (10, 19))
+        now[0] = 100
+        self.assertEqual(stats.count, 0)
+        self.assertIsNone(stats.mean)
+        self.assertIsNone(stats.percentile(99))
+
+    def test_summary(self):
+        stats = structure.RollingStats(size=100)
+        for value in range(101):
+            stats.add(value)
+        summary = stats.summary()
+        self.assertEqual(summary['p50'], 50.5)
+        self.assertEqual(summary['min'], 1)
+        self.assertRaises(ValueError, stats.percentile, 101)
+
+
+class QuantileSketchTestCases(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.values = [random.expovariate(10) for _ in range(10000)]
+
+    def _assert_quantiles(self, sketch, values):
+        values = sorted(values)
+        for q in [0.5, 0.9, 0.99, 0.999]:
+            expected = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q), expected,
+                                   delta=expected * 0.02)
+
+    def test_quantile(self):
+        sketch = structure.QuantileSketch(relative_error=0.01)
+        for value in self.values:
+            sketch.record(value)
+        self.assertEqual(len(sketch), 10000)
+        self._assert_quantiles(sketch, self.values)
+        self.assertEqual(sketch.quantile(0), min(self.values))
+        self.assertEqual(sketch.quantile(1), max(self.values))
+        self.assertRaises(ValueError, sketch.record, -1)
+
+    def test_merge_and_serialize(self):
+        sketches = [structure.QuantileSketch() for _ in range(4)]
+        for i, value in enumerate(self.values):
+            sketches[i % 4].record(value)
+        merged = structure.QuantileSketch()
+        for sketch in sketches:
+            merged.merge(structure.QuantileSketch.loads(sketch.dumps()))
+        self.assertEqual(merged.count, 10000)
+        self._assert_quantiles(merged, self.values)
+        self.assertLess(len(merged.dumps()), 4096)
+
+    def test_zero_and_empty(self):
+        sketch = structure.QuantileSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+        self.assertEqual(sketch.to_fields(), {'count': 0})
+        for value in [0, 0, 0, 5]:
+            sketch.record(value)
+        self.assertEqual(sketch.quantile(0.5), 0)
+        self.assertEqual(set(sketch.to_fields()),
+                         {'count', 'min', 'max', 'p50', 'p90', 'p99',
+                          'p99.9'})